@@ -0,0 +1,19 @@
+"""A minimal MCP server for the benchmarks with a single echo tool."""
+
+import asyncio
+
+from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP("benchmark-echo", log_level="WARNING")
+
+
+@mcp.tool()
+async def echo(message: str, delay: float = 0.0) -> str:
+    """Echo the message back, optionally after a delay in seconds."""
+    if delay > 0:
+        await asyncio.sleep(delay)
+    return message
+
+
+if __name__ == "__main__":
+    mcp.run()
@@ -0,0 +1,92 @@
+"""A local stand-in for the signal-cli-rest-api, with just the endpoints the client uses.
+
+Incoming messages are pushed to the connected clients of the `/v1/receive/<number>` websocket. Sent messages are
+passed to the `on_send` callback. Attachments are served from memory.
+"""
+
+import asyncio
+import json
+import logging
+
+from websockets.asyncio.server import serve
+
+logger = logging.getLogger("benchmark")
+
+
+class FakeSignalApi:
+    def __init__(self, on_send):
+        self.on_send = on_send
+        self.attachments = {}
+        self.connected = asyncio.Event()
+        self.request_counts = {}
+        self._connections = set()
+        self._http_server = None
+        self._websocket_server = None
+
+    async def start(self, host="127.0.0.1"):
+        """Starts the HTTP and websocket servers on free ports and returns their base urls."""
+        self._http_server = await asyncio.start_server(self._handle_http_connection, host, 0)
+        self._websocket_server = await serve(self._handle_websocket, host, 0)
+        http_port = self._http_server.sockets[0].getsockname()[1]
+        websocket_port = next(iter(self._websocket_server.sockets)).getsockname()[1]
+        return f"http://{host}:{http_port}", f"ws://{host}:{websocket_port}"
+
+    async def stop(self):
+        self._websocket_server.close()
+        self._http_server.close()
+        await self._websocket_server.wait_closed()
+
+    async def push_message(self, source, message, attachments=None):
+        envelope = {"source": source, "dataMessage": {"message": message, "attachments": attachments or []}}
+        data = json.dumps({"envelope": envelope})
+        for connection in list(self._connections):
+            await connection.send(data)
+
+    async def _handle_websocket(self, connection):
+        self._connections.add(connection)
+        self.connected.set()
+        try:
+            await connection.wait_closed()
+        finally:
+            self._connections.discard(connection)
+            if not self._connections:
+                self.connected.clear()
+
+    async def _handle_http_connection(self, reader, writer):
+        try:
+            # Keep-alive: the client reuses the connection for several requests.
+            while request_line := await reader.readline():
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()).strip():
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, content_type, response_body = await self._handle_request(method, path, body)
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(response_body)}\r\n\r\n".encode("latin-1")
+                    + response_body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, method, path, body):
+        endpoint = "/".join(path.split("/")[:3])
+        self.request_counts[f"{method} {endpoint}"] = self.request_counts.get(f"{method} {endpoint}", 0) + 1
+
+        if method == "POST" and path == "/v2/send":
+            payload = json.loads(body)
+            for recipient in payload["recipients"]:
+                self.on_send(recipient, payload.get("message", ""), len(payload.get("base64_attachments", [])))
+            return "201 Created", "application/json", b'{"timestamp": "0"}'
+        if method in ("PUT", "DELETE") and path.startswith("/v1/typing-indicator/"):
+            return "204 No Content", "application/json", b""
+        if method == "GET" and path.startswith("/v1/attachments/"):
+            attachment = self.attachments.get(path.rsplit("/", 1)[1])
+            if attachment is not None:
+                return "200 OK", "application/octet-stream", attachment
+        return "404 Not Found", "application/json", b'{"error": "not found"}'
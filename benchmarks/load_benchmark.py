@@ -0,0 +1,264 @@
+"""Offline end-to-end load benchmark of the signal MCP client.
+
+Runs `main_loop` against a fake signal-cli-rest-api, a fake LLM with a configurable latency and a local echo
+MCP server, so no Signal, LLM or fal.ai account is needed. Every simulated user sends a message, waits for the
+reply and sends the next one. The benchmark reports the throughput, the end-to-end latency percentiles and the
+peak memory usage.
+
+Usage:
+    uv run benchmarks/load_benchmark.py --users 20 --messages-per-user 10 --llm-latency 0.2
+    uv run benchmarks/load_benchmark.py --json -- --max-concurrent-turns 4
+
+Arguments after `--` are passed to the client, e.g. `--history-backend json_files`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# The client reads these when it is imported.
+os.environ.setdefault("SIGNAL_PHONE_NUMBER", "+10000000000")
+os.environ.setdefault("CLIENT_LOG_LEVEL", "WARNING")
+os.environ.setdefault("SERVER_LOG_LEVEL", "WARNING")
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fake_signal_api import FakeSignalApi
+from litellm import ModelResponse
+from litellm.types.utils import ChatCompletionMessageToolCall, Choices, Function, Message, Usage
+
+MODEL_NAME = "fake/benchmark"
+ECHO_MCP_SERVER_PATH = Path(__file__).resolve().parent / "echo_mcp_server.py"
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+def get_peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak_rss = resource.getrusage(who).ru_maxrss
+    return peak_rss / 1024 / 1024 if sys.platform == "darwin" else peak_rss / 1024
+
+
+def make_response(content=None, tool_name=None, tool_arguments=None):
+    tool_calls = None
+    if tool_name:
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=f"call_{random.getrandbits(64):016x}",
+                type="function",
+                function=Function(name=tool_name, arguments=json.dumps(tool_arguments)),
+            )
+        ]
+    return ModelResponse(
+        model=MODEL_NAME,
+        choices=[Choices(message=Message(content=content, tool_calls=tool_calls))],
+        usage=Usage(prompt_tokens=100, completion_tokens=20, total_tokens=120),
+    )
+
+
+def get_text(message):
+    content = message.get("content")
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def create_fake_completion(llm_latency, tool_delay):
+    """Returns a stand-in for litellm's acompletion that answers like a model using the echo and reply tools."""
+
+    async def fake_completion(model, messages, tools=None, **kwargs):
+        await asyncio.sleep(llm_latency)
+        last_message = messages[-1]
+        if last_message["role"] == "user":
+            text = get_text(last_message)
+            tool_names = {tool["function"]["name"] if "function" in tool else tool["name"] for tool in tools or []}
+            if "[tool]" in text and "echo" in tool_names:
+                return make_response(tool_name="echo", tool_arguments={"message": text[-200:], "delay": tool_delay})
+            return make_response(tool_name="reply_to_user", tool_arguments={"reply_message": f"reply: {text[-200:]}"})
+        if last_message["role"] == "tool" and last_message.get("name") != "reply_to_user":
+            return make_response(
+                tool_name="reply_to_user", tool_arguments={"reply_message": f"tool result: {get_text(last_message)}"}
+            )
+        return make_response()
+
+    return fake_completion
+
+
+class LoadBenchmark:
+    def __init__(self, options):
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.latencies = []
+        self.errors = 0
+        self.timeouts = 0
+        self._pending_replies = {}
+        self.fake_signal_api = FakeSignalApi(self.on_send)
+
+    def on_send(self, recipient, message, attachment_count):
+        future = self._pending_replies.pop(recipient, None)
+        if future is not None and not future.done():
+            future.set_result(message)
+
+    def make_message(self, user, index):
+        """Returns the text and the attachments of the next message, picked by the configured message mix."""
+        text = f"Message {index} from {user}, please echo it back"
+        attachments = []
+        choice = self.random.random()
+        if choice < self.options.tool_ratio:
+            text += " [tool]"
+        elif choice < self.options.tool_ratio + self.options.image_ratio:
+            attachments.append(self.make_attachment("image/png"))
+        elif choice < self.options.tool_ratio + self.options.image_ratio + self.options.voice_ratio:
+            attachments.append(self.make_attachment("audio/aac"))
+        return text, attachments
+
+    def make_attachment(self, content_type):
+        attachment_id = f"{self.random.getrandbits(64):016x}"
+        self.fake_signal_api.attachments[attachment_id] = self.random.randbytes(self.options.attachment_size)
+        return {"id": attachment_id, "contentType": content_type, "size": self.options.attachment_size}
+
+    async def run_user(self, user):
+        await asyncio.sleep(self.random.random() * self.options.ramp_up)
+        for index in range(self.options.messages_per_user):
+            text, attachments = self.make_message(user, index)
+            future = asyncio.get_running_loop().create_future()
+            self._pending_replies[user] = future
+            start_time = time.perf_counter()
+            await self.fake_signal_api.push_message(user, text, attachments)
+            try:
+                reply = await asyncio.wait_for(future, timeout=self.options.reply_timeout)
+            except asyncio.TimeoutError:
+                self._pending_replies.pop(user, None)
+                self.timeouts += 1
+                continue
+            self.latencies.append(time.perf_counter() - start_time)
+            if reply.startswith("ERROR") or reply.startswith("Stopped processing"):
+                self.errors += 1
+
+    def write_config(self, directory):
+        config_path = directory / "config.json"
+        server = {"name": "echo", "command": sys.executable, "args": [str(ECHO_MCP_SERVER_PATH)]}
+        if self.options.mcp_instances > 1:
+            server["instances"] = self.options.mcp_instances
+        config_path.write_text(json.dumps({"servers": [server]}))
+        return config_path
+
+    async def run(self):
+        http_base_url, ws_base_url = await self.fake_signal_api.start()
+        os.environ["SIGNAL_HTTP_BASE_URL"] = http_base_url
+        os.environ["SIGNAL_WS_BASE_URL"] = ws_base_url
+
+        # Imported after the environment is set, because the client reads its configuration on import.
+        from signal_mcp_client import llm, main
+
+        llm.acompletion = create_fake_completion(self.options.llm_latency, self.options.tool_delay)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            session_save_dir = Path(self.options.session_save_dir or temp_dir)
+            client_args = main.parse_args(
+                [
+                    "--config",
+                    str(self.write_config(Path(temp_dir))),
+                    "--session-save-dir",
+                    str(session_save_dir),
+                    "--available-models",
+                    MODEL_NAME,
+                    "--default-model-name",
+                    MODEL_NAME,
+                    "--default-system-prompt",
+                    "You are a benchmark bot.",
+                    "--default-llm-chat-message-context-limit",
+                    "20",
+                    "--transcription-backend",
+                    "static",
+                    *self.options.client_args,
+                ]
+            )
+            client_task = asyncio.create_task(main.main_loop(client_args))
+            try:
+                await asyncio.wait_for(self.fake_signal_api.connected.wait(), timeout=self.options.startup_timeout)
+                start_time = time.perf_counter()
+                await asyncio.gather(*(self.run_user(f"+1555{i:07d}") for i in range(self.options.users)))
+                duration = time.perf_counter() - start_time
+            finally:
+                client_task.cancel()
+                await asyncio.gather(client_task, return_exceptions=True)
+                await self.fake_signal_api.stop()
+
+        return self.report(duration)
+
+    def report(self, duration):
+        total_messages = self.options.users * self.options.messages_per_user
+        return {
+            "users": self.options.users,
+            "messages": total_messages,
+            "completed": len(self.latencies),
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "duration_seconds": round(duration, 3),
+            "messages_per_second": round(len(self.latencies) / duration, 2) if duration > 0 else None,
+            "latency_p50_seconds": round(percentile(self.latencies, 0.50) or 0, 4),
+            "latency_p95_seconds": round(percentile(self.latencies, 0.95) or 0, 4),
+            "latency_p99_seconds": round(percentile(self.latencies, 0.99) or 0, 4),
+            "peak_rss_mb": round(get_peak_rss_mb(resource.RUSAGE_SELF), 1),
+            "peak_rss_mcp_servers_mb": round(get_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+            "signal_api_requests": self.fake_signal_api.request_counts,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end load benchmark of the signal MCP client")
+    parser.add_argument("--users", type=int, default=10, help="Number of simulated users.")
+    parser.add_argument("--messages-per-user", type=int, default=10, help="Messages each user sends one after another.")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="Latency of every fake LLM call in seconds.")
+    parser.add_argument("--tool-delay", type=float, default=0.0, help="Latency of every echo tool call in seconds.")
+    parser.add_argument("--tool-ratio", type=float, default=0.5, help="Share of messages that trigger a tool call.")
+    parser.add_argument("--image-ratio", type=float, default=0.1, help="Share of messages with an image.")
+    parser.add_argument("--voice-ratio", type=float, default=0.1, help="Share of voice messages.")
+    parser.add_argument("--attachment-size", type=int, default=64 * 1024, help="Size of attachments in bytes.")
+    parser.add_argument("--mcp-instances", type=int, default=1, help="Number of echo MCP server instances.")
+    parser.add_argument("--ramp-up", type=float, default=1.0, help="Users start at random times in this many seconds.")
+    parser.add_argument("--reply-timeout", type=float, default=60, help="Seconds to wait for a reply.")
+    parser.add_argument("--startup-timeout", type=float, default=60, help="Seconds to wait for the client to connect.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random message mix.")
+    parser.add_argument("--session-save-dir", type=Path, help="Keep the sessions here instead of a temp directory.")
+    parser.add_argument("--json", action="store_true", help="Print the results as json.")
+    parser.add_argument(
+        "--max-p95-latency",
+        type=float,
+        help="Exit with status 1 if the p95 latency in seconds is higher, or if any message failed, e.g. for CI.",
+    )
+    parser.add_argument("client_args", nargs=argparse.REMAINDER, help="Arguments after -- are passed to the client.")
+    options = parser.parse_args()
+    if options.client_args[:1] == ["--"]:
+        options.client_args = options.client_args[1:]
+
+    results = asyncio.run(LoadBenchmark(options).run())
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key}: {value}")
+
+    failed = results["errors"] > 0 or results["timeouts"] > 0
+    if options.max_p95_latency is not None and (failed or results["latency_p95_seconds"] > options.max_p95_latency):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import time
+
+from signal_mcp_client import history
+from signal_mcp_client.build_in_tools import get_settings
+
+logger = logging.getLogger("signal_mcp_client")
+
+# The first run waits a bit, so archiving doesn't slow down the startup.
+ARCHIVAL_START_DELAY_SECONDS = 60
+
+
+async def archive_session(args, session_id, now):
+    """Archives the old messages of a session and returns the number of archived messages.
+
+    Active sessions keep the last `archive_keep_messages` messages. Sessions without a new message for
+    `archive_idle_days` only keep their chat message context.
+    """
+    last_modified = history.get_last_modified(args.session_save_dir, session_id)
+    if last_modified is None:
+        return 0
+    keep_last = args.archive_keep_messages
+    if args.archive_idle_days > 0 and now - last_modified > args.archive_idle_days * 24 * 60 * 60:
+        # Idle sessions are not cached, so they don't evict the sessions that are in use.
+        settings = get_settings(args, session_id, cache=False)
+        keep_last = min(keep_last, settings["llm_chat_message_context_limit"])
+    return await history.archive_history(args.session_save_dir, session_id, keep_last)
+
+
+async def run_archival(args):
+    """Periodically moves the old messages of all sessions into compressed archives."""
+    await asyncio.sleep(ARCHIVAL_START_DELAY_SECONDS)
+    while True:
+        now = time.time()
+        args.session_save_dir.mkdir(parents=True, exist_ok=True)
+        session_ids = sorted(
+            path.name for path in args.session_save_dir.iterdir() if path.is_dir() and not path.name.startswith(".")
+        )
+        archived_count = 0
+        for session_id in session_ids:
+            try:
+                archived_count += await archive_session(args, session_id, now)
+            except Exception as e:
+                logger.error(f"[{session_id}] Failed to archive the chat history: {e!r}")
+        logger.info(f"Archived {archived_count} messages of {len(session_ids)} sessions")
+        await asyncio.sleep(args.archive_interval_hours * 60 * 60)
@@ -0,0 +1,142 @@
+import asyncio
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger("signal_mcp_client")
+
+
+def file_sha256(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class AttachmentStore:
+    """Content-addressed store for the images users send.
+
+    Every image is downloaded once into `<session save dir>/.blobs`, keyed by its sha256 hash. Each session has
+    an `images/index.json` that maps friendly names like `image_00003.jpg` to blob hashes, and the friendly path
+    is a hard link to the blob, so the LLM can keep using plain file paths. Sending the same image again, also as
+    a forwarded message, reuses the existing name instead of storing a copy.
+    """
+
+    def __init__(self, session_save_dir, signal_client):
+        self.session_save_dir = session_save_dir
+        self.blob_dir = session_save_dir / ".blobs"
+        self.signal_client = signal_client
+        self._session_locks = {}
+        # The index of each session is only read once, the store is the only writer.
+        self._indexes = {}
+
+    def _blob_path(self, digest, ext):
+        return self.blob_dir / digest[:2] / f"{digest}{ext}"
+
+    async def _download(self, attachment_id):
+        _, ext = os.path.splitext(attachment_id)
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.blob_dir, suffix=".part", delete=False) as temp_file:
+            try:
+                digest = await self.signal_client.download_attachment(attachment_id, temp_file)
+            except BaseException:
+                os.remove(temp_file.name)
+                raise
+
+        blob_path = self._blob_path(digest, ext)
+        if blob_path.exists():
+            os.remove(temp_file.name)
+        else:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_file.name, blob_path)
+        return digest, ext
+
+    def _load_index(self, image_dir):
+        index_path = image_dir / "index.json"
+        if index_path.exists():
+            with open(index_path) as f:
+                return json.load(f)
+
+        # Images saved before the index existed are hashed once, so their names are kept and not reused.
+        index = {}
+        if image_dir.exists():
+            for image_path in sorted(image_dir.glob("image_*")):
+                index[image_path.name] = file_sha256(image_path)
+        return index
+
+    def _save_index(self, image_dir, index):
+        index_path = image_dir / "index.json"
+        temp_index_path = image_dir / "index.json.tmp"
+        with open(temp_index_path, "w") as f:
+            json.dump(index, f, indent=2)
+        os.replace(temp_index_path, index_path)
+
+    def _link_or_copy(self, blob_path, image_path):
+        try:
+            os.link(blob_path, image_path)
+        except OSError as e:
+            # Hard links don't work across file systems and on some file systems at all.
+            if e.errno not in (errno.EXDEV, errno.EPERM):
+                raise
+            with open(blob_path, "rb") as src, open(image_path, "xb") as dst:
+                shutil.copyfileobj(src, dst)
+
+    def _get_index(self, session_id, image_dir):
+        index = self._indexes.get(session_id)
+        if index is None:
+            image_dir.mkdir(parents=True, exist_ok=True)
+            index = self._indexes[session_id] = self._load_index(image_dir)
+        return index
+
+    def _add_to_session(self, index, image_dir, session_id, digest, ext):
+        for name, name_digest in index.items():
+            if name_digest == digest:
+                logger.info(f"[{session_id}] Image {digest[:12]} was already received as {name}")
+                return image_dir / name
+
+        # Names are not reused, also if a file exists that is not in the index, e.g. after a gap in legacy names.
+        used_stems = {os.path.splitext(name)[0] for name in index}
+        number = len(index)
+        while True:
+            if f"image_{number:05d}" not in used_stems:
+                image_path = image_dir / f"image_{number:05d}{ext}"
+                try:
+                    self._link_or_copy(self._blob_path(digest, ext), image_path)
+                    break
+                except FileExistsError:
+                    pass
+            number += 1
+        index[image_path.name] = digest
+        return image_path
+
+    async def save_image_attachments(self, session_id, attachments):
+        """Downloads all image attachments of a message concurrently and returns their paths in the session."""
+        attachment_ids = []
+        for attachment in attachments:
+            content_type = attachment.get("contentType", "").lower()
+            attachment_id = attachment.get("id")
+            if content_type.startswith("image/") and attachment_id:
+                attachment_ids.append(attachment_id)
+            else:
+                logger.info("Ignoring attachments other then images")
+        if not attachment_ids:
+            return []
+
+        downloads = await asyncio.gather(*(self._download(attachment_id) for attachment_id in attachment_ids))
+
+        session_lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        async with session_lock:
+            image_dir = self.session_save_dir / session_id / "images"
+            index = self._get_index(session_id, image_dir)
+            index_size = len(index)
+            image_paths = [self._add_to_session(index, image_dir, session_id, digest, ext) for digest, ext in downloads]
+            if len(index) > index_size:
+                self._save_index(image_dir, index)
+        for attachment_id, image_path in zip(attachment_ids, image_paths):
+            logger.info(f"Successfully fetched and saved attachment ID: {attachment_id} to {image_path}")
+        return list(dict.fromkeys(image_paths))
@@ -1,14 +1,15 @@
-import base64
+import asyncio
 import json
 import logging
 from pathlib import Path
 
-from litellm import completion
-
-from signal_mcp_client import history
+from signal_mcp_client import history, image_cache, llm, session_cache, tool_results
+from signal_mcp_client.attachment_store import file_sha256
 
 logger = logging.getLogger("signal_mcp_client")
 
+DESCRIBE_IMAGES_PROMPT = "You are a helpful assistant that can create a short description of the images."
+
 
 def get_build_in_tools(available_models):
     return [
@@ -33,6 +34,17 @@ def get_build_in_tools(available_models):
                             "type": "integer",
                             "description": "The number of chat messages included into the context of the LLM.",
                         },
+                        "llm_context_token_budget": {
+                            "type": "integer",
+                            "description": "The maximum number of tokens of the chat messages included into the context of the LLM. 0 means no token limit.",
+                        },
+                        "pinned_tools": {
+                            "type": "array",
+                            "items": {
+                                "type": "string",
+                            },
+                            "description": "The names of tools that are always available, even if they don't seem relevant to the recent messages.",
+                        },
                     },
                     "required": [],
                 },
@@ -94,6 +106,27 @@ def get_build_in_tools(available_models):
                 },
             },
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "read_tool_result",
+                "description": "Read a page of a tool result that was too long and got truncated.",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "result_id": {
+                            "type": "string",
+                            "description": "The result_id mentioned in the truncated tool result.",
+                        },
+                        "page": {
+                            "type": "integer",
+                            "description": "The page to read, starting at 1.",
+                        },
+                    },
+                    "required": ["result_id", "page"],
+                },
+            },
+        },
         {
             "type": "function",
             "function": {
@@ -126,15 +159,24 @@ def get_default_settings(args):
         "model_name": args.default_model_name,
         "system_prompt": args.default_system_prompt,
         "llm_chat_message_context_limit": args.default_llm_chat_message_context_limit,
+        "llm_context_token_budget": args.default_llm_context_token_budget,
+        "pinned_tools": [],
     }
 
 
-def get_session_settings(session_dir, session_id):
+def get_session_settings(session_dir, session_id, cache=True):
+    """Returns the settings a session changed. With `cache=False` settings read from disk are not cached."""
+    session_settings = session_cache.cache.get_settings(session_dir / session_id)
+    if session_settings is not None:
+        return session_settings
+
     session_settings_path = session_dir / session_id / "settings.json"
     if session_settings_path.exists():
         session_settings = json.load(open(session_settings_path))
     else:
         session_settings = {}
+    if cache:
+        session_cache.cache.set_settings(session_dir / session_id, session_settings)
     return session_settings
 
 
@@ -147,13 +189,14 @@ def update_settings(session_dir, session_id, **tool_arguments):
     session_settings_path.parent.mkdir(parents=True, exist_ok=True)
     with open(session_settings_path, "w") as f:
         json.dump(session_settings, f)
+    session_cache.cache.set_settings(session_dir / session_id, session_settings)
     return True, "settings updated"
 
 
-def get_settings(args, session_id):
+def get_settings(args, session_id, cache=True):
     logger.debug(f"get settings for session: {session_id}")
     settings = get_default_settings(args)
-    session_settings = get_session_settings(args.session_save_dir, session_id)
+    session_settings = get_session_settings(args.session_save_dir, session_id, cache=cache)
     settings.update(session_settings)
     return settings
 
@@ -163,6 +206,7 @@ def reset_settings(session_dir, session_id):
     session_settings_path = session_dir / session_id / "settings.json"
     if session_settings_path.exists():
         session_settings_path.unlink()
+    session_cache.cache.invalidate_settings(session_dir / session_id)
 
     return True, "settings reset to default"
 
@@ -173,33 +217,40 @@ def reset_chat_history(session_dir, session_id):
     return True, "chat history reset"
 
 
-def describe_images(args, session_id, image_paths):
-    image_contents = []
+async def describe_images(args, session_id, image_paths):
+    image_paths = [Path(image_path) for image_path in image_paths]
     for image_path in image_paths:
-        image_path = Path(image_path)
         if not image_path.exists():
             return True, f"Error: Image file '{image_path}' not found."
 
-        with image_path.open("rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
-            suffix = image_path.suffix.lstrip(".")
-            if suffix == "jpg":
-                suffix = "jpeg"
-            image_contents.append(
-                {"type": "image_url", "image_url": {"url": f"data:image/{suffix};base64,{base64_image}"}}
-            )
+    cache_dir = image_cache.get_cache_dir(args.session_save_dir)
+    model_name = get_settings(args, session_id)["model_name"]
+    image_hashes = [await asyncio.to_thread(file_sha256, image_path) for image_path in image_paths]
+    description = image_cache.get_cached_description(cache_dir, image_hashes, model_name, DESCRIBE_IMAGES_PROMPT)
+    if description is not None:
+        logger.info(f"Using cached description for {len(image_paths)} image(s)")
+        return True, description
+
+    image_contents = []
+    for image_path, image_hash in zip(image_paths, image_hashes):
+        image_url = await asyncio.to_thread(
+            image_cache.prepare_image, cache_dir, image_path, image_hash, args.describe_image_max_edge
+        )
+        image_contents.append({"type": "image_url", "image_url": {"url": image_url}})
 
     messages = [
-        {"role": "system", "content": "You are a helpful assistant that can create a short description of the images."},
+        {"role": "system", "content": DESCRIBE_IMAGES_PROMPT},
         {"role": "user", "content": image_contents},
     ]
-    current_settings = get_settings(args, session_id)
-    response = completion(
-        model=current_settings["model_name"],
+    response = await llm.completion(
+        args,
+        model=model_name,
         messages=messages,
         max_tokens=500,
     )
-    return True, response.choices[0].message.content
+    description = response.choices[0].message.content
+    image_cache.save_description(cache_dir, image_hashes, model_name, DESCRIBE_IMAGES_PROMPT, description)
+    return True, description
 
 
 def reply_to_user(args, session_id, reply_message, media_file_paths=None):
@@ -208,7 +259,7 @@ def reply_to_user(args, session_id, reply_message, media_file_paths=None):
     return True, "success"
 
 
-def run_build_in_tools(args, session_id, tool_name, tool_arguments):
+async def run_build_in_tools(args, session_id, tool_name, tool_arguments):
     session_dir = args.session_save_dir
     if tool_name == "update_settings":
         return update_settings(session_dir, session_id, **tool_arguments)
@@ -220,7 +271,14 @@ def run_build_in_tools(args, session_id, tool_name, tool_arguments):
     elif tool_name == "reset_chat_history":
         return reset_chat_history(session_dir, session_id)
     elif tool_name == "describe_images":
-        return describe_images(args, session_id, tool_arguments.get("image_paths"))
+        return await describe_images(args, session_id, tool_arguments.get("image_paths"))
+    elif tool_name == "read_tool_result":
+        return True, tool_results.read_tool_result(
+            session_dir / session_id,
+            tool_arguments.get("result_id"),
+            tool_arguments.get("page", 1),
+            args.tool_result_page_size,
+        )
     elif tool_name == "reply_to_user":
         return reply_to_user(
             args, session_id, tool_arguments.get("reply_message"), tool_arguments.get("media_file_paths")
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+
+from signal_mcp_client import metrics
+
+logger = logging.getLogger("signal_mcp_client")
+
+
+# Upper limit for the number of messages merged into one turn, so a flood of messages can't grow a turn forever.
+MAX_BATCH_SIZE = 20
+
+
+class SessionDispatcher:
+    """Runs the messages of each session in order on a dedicated worker, while different sessions run in parallel.
+
+    If `debounce_seconds` is positive, the worker passes the messages to `handle_messages` in batches. A batch
+    contains all messages that were already waiting, and after the last of them the worker waits up to
+    `debounce_seconds` for more messages, so a burst of short messages is handled together. Otherwise every
+    message is handled in its own turn.
+    The number of turns processed at the same time over all sessions is capped by `max_concurrent_turns`.
+    Workers exit after `idle_timeout` seconds without new messages and are recreated on demand.
+    """
+
+    def __init__(self, handle_messages, max_concurrent_turns, idle_timeout=60.0, debounce_seconds=0.0):
+        self._handle_messages = handle_messages
+        self._semaphore = asyncio.Semaphore(max_concurrent_turns)
+        self._idle_timeout = idle_timeout
+        self._debounce_seconds = debounce_seconds
+        self._queues = {}
+        self._workers = {}
+
+    def submit(self, session_id, item):
+        queue = self._queues.get(session_id)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[session_id] = queue
+            self._workers[session_id] = asyncio.create_task(self._run_worker(session_id, queue))
+        queue.put_nowait(item)
+        metrics.QUEUED_MESSAGES.inc()
+        logger.debug(f"[{session_id}] Queued message, {queue.qsize()} waiting for this session")
+
+    async def _run_worker(self, session_id, queue):
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=self._idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    # No await between the check and the removal, so no message can slip in unnoticed.
+                    del self._queues[session_id]
+                    del self._workers[session_id]
+                    return
+                continue
+
+            items = [item]
+            while self._debounce_seconds > 0 and len(items) < MAX_BATCH_SIZE:
+                if not queue.empty():
+                    items.append(queue.get_nowait())
+                    continue
+                try:
+                    items.append(await asyncio.wait_for(queue.get(), timeout=self._debounce_seconds))
+                except asyncio.TimeoutError:
+                    break
+
+            async with self._semaphore:
+                metrics.QUEUED_MESSAGES.dec(len(items))
+                metrics.ACTIVE_TURNS.inc()
+                try:
+                    await self._handle_messages(session_id, items)
+                except Exception as e:
+                    logger.exception(f"[{session_id}] Unhandled error while processing message: {e}")
+                finally:
+                    metrics.ACTIVE_TURNS.dec()
+
+    async def close(self):
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        metrics.QUEUED_MESSAGES.dec(sum(queue.qsize() for queue in self._queues.values()))
+        self._queues.clear()
+        self._workers.clear()
@@ -1,42 +1,158 @@
+import asyncio
 import json
 import logging
-import os
-import time
 from datetime import datetime
 
+from litellm import token_counter
+
+from signal_mcp_client import session_cache
+from signal_mcp_client.history_backends import HISTORY_BACKENDS, SegmentLogBackend, get_session_backend
+
 logger = logging.getLogger("signal_mcp_client")
 
+_backend = SegmentLogBackend()
+
+
+def set_backend(backend_name):
+    global _backend
+    _backend = HISTORY_BACKENDS[backend_name]()
+    logger.info(f"Using history backend: {backend_name}")
+
 
 def get_history(session_dir, session_id, limit):
-    messages_dir = session_dir / session_id / "messages"
-    if not messages_dir.exists():
-        return []
-    message_files = sorted(messages_dir.glob("*.json"))
-    messages = [json.load(open(file_path)) for file_path in message_files[-limit:]]
-    if messages[0]["role"] == "tool":
+    session_path = session_dir / session_id
+    messages = session_cache.cache.get_messages(session_path, limit)
+    if messages is None:
+        read_limit = max(limit, session_cache.cache.max_messages)
+        messages = _backend.read_tail(session_path, read_limit)
+        session_cache.cache.set_messages(session_path, messages, complete=len(messages) < read_limit)
+    return trim_context(messages, limit)
+
+
+def trim_context(messages, limit):
+    """Returns the last `limit` messages without tool responses whose tool call was cut off."""
+    messages = messages[-limit:] if limit > 0 else []
+    while messages and messages[0]["role"] == "tool":
         messages = messages[1:]
     return messages
 
 
-def add_message(session_dir, session_id, message):
-    messages_dir = session_dir / session_id / "messages"
-    messages_dir.mkdir(parents=True, exist_ok=True)
+def count_tokens(message):
+    """Returns the token count of a message, computed once and stored in its `_tokens` field."""
+    if "_tokens" not in message:
+        try:
+            message["_tokens"] = token_counter(messages=[strip_metadata(message)])
+        except Exception:
+            message["_tokens"] = len(json.dumps(message)) // 4
+    return message["_tokens"]
+
+
+def strip_metadata(message):
+    """Returns a copy of the message without the internal fields that are not sent to the LLM."""
+    return {key: value for key, value in message.items() if not key.startswith("_")}
+
+
+def build_context(messages, limit, token_budget):
+    """Returns the newest messages that fit into `limit` messages and `token_budget` tokens, ready for the LLM.
+
+    Messages are added newest first. An assistant message with tool calls and its tool responses are only added
+    together. The newest message group is always included, even if it exceeds the budget on its own.
+    A `token_budget` of 0 or less only applies the message limit.
+    """
+    messages = trim_context(messages, limit)
+    if token_budget > 0:
+        groups = []
+        group = []
+        for message in reversed(messages):
+            group.insert(0, message)
+            if message["role"] != "tool":
+                groups.append(group)
+                group = []
+
+        selected_groups = []
+        total_tokens = 0
+        for group in groups:
+            group_tokens = sum(count_tokens(message) for message in group)
+            if selected_groups and total_tokens + group_tokens > token_budget:
+                break
+            selected_groups.insert(0, group)
+            total_tokens += group_tokens
+        messages = [message for group in selected_groups for message in group]
+        logger.debug(f"Built context with {len(messages)} messages and {total_tokens} tokens")
+    return [strip_metadata(message) for message in messages]
 
-    file_path = messages_dir / f"{int(time.time() * 1000)}.json"
-    if file_path.exists():
-        time.sleep(0.001)
-        file_path = messages_dir / f"{int(time.time() * 1000)}.json"
 
-    with open(file_path, "w") as f:
-        json.dump(message, f, indent=2)
+def add_message(session_dir, session_id, message):
+    count_tokens(message)
+    _backend.append(session_dir / session_id, message)
+    session_cache.cache.append_message(session_dir / session_id, message)
 
 
 def clear_history(session_dir, session_id):
-    messages_dir = session_dir / session_id / "messages"
-    if messages_dir.exists():
-        message_files = sorted(messages_dir.glob("*.json"))
-        for file_path in message_files[:-2]:
-            os.remove(file_path)
+    _backend.clear(session_dir / session_id, keep_last=2)
+    session_cache.cache.invalidate_messages(session_dir / session_id)
+    delete_summary(session_dir, session_id)
+
+
+async def archive_history(session_dir, session_id, keep_last):
+    """Moves all but the last `keep_last` messages into the compressed archive of the session.
+
+    Reading and compressing the messages runs in a thread, only swapping the files runs in the event loop.
+    """
+    session_path = session_dir / session_id
+    plan = await asyncio.to_thread(_backend.prepare_archive, session_path, keep_last)
+    if plan is None:
+        return 0
+    archived_count = _backend.finish_archive(session_path, plan)
+    summary = get_summary(session_dir, session_id)
+    if archived_count and summary and not _backend.stable_sequence_numbers:
+        summary["until"] = max(summary["until"] - archived_count, 0)
+        save_summary(session_dir, session_id, summary)
+    return archived_count
+
+
+def get_message_range(session_dir, session_id):
+    """Returns the sequence numbers of the oldest stored message and of the next message."""
+    session_path = session_dir / session_id
+    return _backend.first(session_path), _backend.count(session_path)
+
+
+def read_messages(session_dir, session_id, start, end):
+    return _backend.read_range(session_dir / session_id, start, end)
+
+
+def get_summary(session_dir, session_id):
+    """Returns the rolling summary of the older messages of a session, or None if there is none yet.
+
+    The summary is a dict with its `text` and the sequence number `until` of the first message it doesn't cover.
+    """
+    summary_path = session_dir / session_id / "summary.json"
+    if not summary_path.exists():
+        return None
+    with open(summary_path) as f:
+        return json.load(f)
+
+
+def save_summary(session_dir, session_id, summary):
+    summary_path = session_dir / session_id / "summary.json"
+    temp_path = summary_path.with_name("summary.json.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    temp_path.replace(summary_path)
+
+
+def delete_summary(session_dir, session_id):
+    (session_dir / session_id / "summary.json").unlink(missing_ok=True)
+
+
+def get_last_modified(session_dir, session_id):
+    """Returns the time a message was last added to the session, or None if it has no messages."""
+    return _backend.last_modified(session_dir / session_id)
+
+
+def export_history(session_path):
+    """Yields all messages of a session including the archived ones, oldest first."""
+    return get_session_backend(session_path).export(session_path)
 
 
 def add_user_message(session_dir, session_id, content):
@@ -44,6 +160,7 @@ def add_user_message(session_dir, session_id, content):
     message = {"role": "user", "content": [{"type": "text", "text": f"{timestamp_str} {content}"}]}
     add_message(session_dir, session_id, message)
     logger.info(f"user_message: {message['content'][0]['text'][:60]}...")
+    return message
 
 
 def add_assistant_message(session_dir, session_id, content, tool_calls=None):
@@ -70,6 +187,8 @@ def add_assistant_message(session_dir, session_id, content, tool_calls=None):
 
     if content or tool_calls:
         add_message(session_dir, session_id, message)
+        return message
+    return None
 
 
 def add_tool_response(session_dir, session_id, tool_call_id, name, tool_result_text):
@@ -82,3 +201,4 @@ def add_tool_response(session_dir, session_id, tool_call_id, name, tool_result_t
     }
     add_message(session_dir, session_id, message)
     logger.info(f"tool_response: {tool_result_text[:60]}...")
+    return message
@@ -0,0 +1,449 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import struct
+import time
+
+logger = logging.getLogger("signal_mcp_client")
+
+# Every index entry stores the byte offset and the byte length of one record in the segment log.
+INDEX_ENTRY = struct.Struct("<QI")
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+
+
+def _encode_record(message):
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _archive_dir(session_path):
+    return session_path / "archive"
+
+
+def _archive_files(session_path, prefix):
+    archive_dir = _archive_dir(session_path)
+    if not archive_dir.exists():
+        return []
+    return sorted(archive_dir.glob(f"{prefix}-*.jsonl.gz"))
+
+
+def _delete_archive(session_path):
+    archive_dir = _archive_dir(session_path)
+    if archive_dir.exists():
+        shutil.rmtree(archive_dir)
+
+
+def _write_archive(session_path, prefix, start, end, records):
+    """Writes json lines records into a gzip compressed archive named by the range of the records."""
+    archive_dir = _archive_dir(session_path)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    archive_path = archive_dir / f"{prefix}-{start:012d}-{end:012d}.jsonl.gz"
+    temp_path = archive_path.with_name(f"{archive_path.name}.tmp")
+    with gzip.open(temp_path, "wb") as f:
+        f.writelines(records)
+    os.replace(temp_path, archive_path)
+    return archive_path
+
+
+def _read_archives(session_path, prefix):
+    for archive_path in _archive_files(session_path, prefix):
+        with gzip.open(archive_path, "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+class JsonFilesBackend:
+    """Stores every message as a separate json file named by its millisecond timestamp.
+
+    This is the original storage format. Reading the tail lists and sorts the whole messages directory.
+    """
+
+    name = "json_files"
+    # Messages are numbered by their position, so removing old messages renumbers the remaining ones.
+    stable_sequence_numbers = False
+
+    def _messages_dir(self, session_path):
+        return session_path / "messages"
+
+    def _message_files(self, session_path):
+        messages_dir = self._messages_dir(session_path)
+        if not messages_dir.exists():
+            return []
+        return sorted(messages_dir.glob("*.json"))
+
+    def append(self, session_path, message):
+        messages_dir = self._messages_dir(session_path)
+        messages_dir.mkdir(parents=True, exist_ok=True)
+
+        file_path = messages_dir / f"{int(time.time() * 1000)}.json"
+        if file_path.exists():
+            time.sleep(0.001)
+            file_path = messages_dir / f"{int(time.time() * 1000)}.json"
+
+        with open(file_path, "w") as f:
+            json.dump(message, f, indent=2)
+
+    def extend(self, session_path, messages):
+        for message in messages:
+            self.append(session_path, message)
+
+    def first(self, session_path):
+        return 0
+
+    def count(self, session_path):
+        return len(self._message_files(session_path))
+
+    def read_range(self, session_path, start, end):
+        message_files = self._message_files(session_path)[max(start, 0) : end]
+        messages = []
+        for file_path in message_files:
+            with open(file_path) as f:
+                messages.append(json.load(f))
+        return messages
+
+    def read_tail(self, session_path, limit):
+        if limit <= 0:
+            return []
+        messages = []
+        for file_path in self._message_files(session_path)[-limit:]:
+            with open(file_path) as f:
+                messages.append(json.load(f))
+        return messages
+
+    def clear(self, session_path, keep_last):
+        """Deletes all but the last `keep_last` messages, also the archived ones."""
+        _delete_archive(session_path)
+        message_files = self._message_files(session_path)
+        for file_path in message_files[: max(len(message_files) - keep_last, 0)]:
+            file_path.unlink()
+
+    def last_modified(self, session_path):
+        messages_dir = self._messages_dir(session_path)
+        return messages_dir.stat().st_mtime if messages_dir.exists() else None
+
+    def prepare_archive(self, session_path, keep_last):
+        """Writes all but the last `keep_last` message files into a gzip compressed archive.
+
+        This only reads the message files, so it can run in a thread. Returns the plan for `finish_archive`,
+        or None if there is nothing to archive.
+        """
+        message_files = self._message_files(session_path)
+        archived_files = message_files[: max(len(message_files) - keep_last, 0)]
+        if not archived_files:
+            return None
+        records = []
+        for file_path in archived_files:
+            with open(file_path) as f:
+                records.append(_encode_record(json.load(f)))
+        start, end = int(archived_files[0].stem), int(archived_files[-1].stem) + 1
+        archive_path = _write_archive(session_path, "messages", start, end, records)
+        return {"archive_path": archive_path, "archived_files": archived_files}
+
+    def finish_archive(self, session_path, plan):
+        """Deletes the archived message files and returns their number."""
+        if not all(file_path.exists() for file_path in plan["archived_files"]):
+            # The history was cleared while the archive was written.
+            plan["archive_path"].unlink(missing_ok=True)
+            return 0
+        for file_path in plan["archived_files"]:
+            file_path.unlink()
+        return len(plan["archived_files"])
+
+    def export(self, session_path):
+        """Yields all messages of a session, the archived ones first."""
+        yield from _read_archives(session_path, "messages")
+        yield from self.read_range(session_path, 0, self.count(session_path))
+
+
+class SegmentLogBackend:
+    """Stores messages as json lines in append-only segment logs with a fixed-width offset index per segment.
+
+    Each session has a `log` directory with segments named by the sequence number of their first message,
+    e.g. `000000000000.log` and `000000000000.idx`. A new segment is started once the current one exceeds
+    `segment_max_bytes`. Sequence numbers keep increasing over the lifetime of a session, also when older
+    messages are removed, so reading the last `limit` messages only touches the last `limit` index entries.
+    """
+
+    name = "segment_log"
+    stable_sequence_numbers = True
+
+    def __init__(self, segment_max_bytes=SEGMENT_MAX_BYTES):
+        self.segment_max_bytes = segment_max_bytes
+        self._checked_session_paths = set()
+
+    def _log_dir(self, session_path):
+        return session_path / "log"
+
+    def _segment_starts(self, session_path, migrate=True):
+        if migrate:
+            self.migrate_legacy_messages(session_path)
+        log_dir = self._log_dir(session_path)
+        if not log_dir.exists():
+            return []
+        return sorted(int(idx_path.stem) for idx_path in log_dir.glob("*.idx"))
+
+    def _segment_paths(self, session_path, start):
+        log_dir = self._log_dir(session_path)
+        return log_dir / f"{start:012d}.log", log_dir / f"{start:012d}.idx"
+
+    def _segment_length(self, session_path, start):
+        _, idx_path = self._segment_paths(session_path, start)
+        return idx_path.stat().st_size // INDEX_ENTRY.size
+
+    def migrate_legacy_messages(self, session_path, delete_legacy=False):
+        """Copies the json message files of a session into a new segment log and returns the number of messages.
+
+        Afterwards the `messages` directory is renamed to `messages.migrated`, or deleted with `delete_legacy`.
+        """
+        if session_path in self._checked_session_paths:
+            return 0
+        self._checked_session_paths.add(session_path)
+        if not (session_path / "messages").exists() or self._log_dir(session_path).exists():
+            return 0
+        logger.info(f"Migrating legacy json message files of {session_path} to the segment log")
+        # The log is written to a temporary directory and renamed at the end, so an interrupted migration is
+        # started again instead of leaving an incomplete log behind.
+        temp_session_path = session_path / ".migrating"
+        if temp_session_path.exists():
+            shutil.rmtree(temp_session_path)
+        message_count = migrate_session(session_path, JsonFilesBackend(), self, temp_session_path)
+        if message_count:
+            os.replace(self._log_dir(temp_session_path), self._log_dir(session_path))
+        shutil.rmtree(temp_session_path, ignore_errors=True)
+
+        legacy_dir = session_path / "messages"
+        migrated_dir = session_path / "messages.migrated"
+        if delete_legacy:
+            shutil.rmtree(legacy_dir)
+        else:
+            # An older migrated directory was copied to the log before as well.
+            if migrated_dir.exists():
+                shutil.rmtree(migrated_dir)
+            legacy_dir.rename(migrated_dir)
+        return message_count
+
+    def _write_segment(self, session_path, start, records):
+        log_path, idx_path = self._segment_paths(session_path, start)
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        self._append_records(log_path, idx_path, records)
+
+    def _append_records(self, log_path, idx_path, records):
+        with open(log_path, "ab") as log_file, open(idx_path, "ab") as idx_file:
+            # In append mode the file position starts at the end, after any record that was never indexed.
+            offset = log_file.tell()
+            entries = []
+            for record in records:
+                log_file.write(record)
+                entries.append(INDEX_ENTRY.pack(offset, len(record)))
+                offset += len(record)
+            log_file.flush()
+            idx_file.write(b"".join(entries))
+
+    def append(self, session_path, message):
+        self.extend(session_path, [message])
+
+    def extend(self, session_path, messages):
+        starts = self._segment_starts(session_path)
+        start = starts[-1] if starts else 0
+        segment_bytes = self._segment_paths(session_path, start)[0].stat().st_size if starts else 0
+        segment_length = self._segment_length(session_path, start) if starts else 0
+
+        records = []
+        for message in messages:
+            if segment_bytes >= self.segment_max_bytes:
+                self._write_segment(session_path, start, records)
+                start, segment_bytes, segment_length, records = start + segment_length, 0, 0, []
+            record = _encode_record(message)
+            records.append(record)
+            segment_bytes += len(record)
+            segment_length += 1
+        if records:
+            self._write_segment(session_path, start, records)
+
+    def first(self, session_path):
+        """Returns the sequence number of the oldest stored message."""
+        starts = self._segment_starts(session_path)
+        return starts[0] if starts else 0
+
+    def count(self, session_path):
+        """Returns the sequence number the next message will get."""
+        starts = self._segment_starts(session_path)
+        if not starts:
+            return 0
+        return starts[-1] + self._segment_length(session_path, starts[-1])
+
+    def _read_segment_records(self, session_path, segment_start, start, end):
+        log_path, idx_path = self._segment_paths(session_path, segment_start)
+        with open(idx_path, "rb") as idx_file:
+            idx_file.seek((start - segment_start) * INDEX_ENTRY.size)
+            idx_data = idx_file.read((end - start) * INDEX_ENTRY.size)
+        entries = [INDEX_ENTRY.unpack_from(idx_data, i) for i in range(0, len(idx_data), INDEX_ENTRY.size)]
+        if not entries:
+            return []
+
+        first_offset = entries[0][0]
+        last_offset, last_length = entries[-1]
+        with open(log_path, "rb") as log_file:
+            log_file.seek(first_offset)
+            data = log_file.read(last_offset + last_length - first_offset)
+        return [data[offset - first_offset : offset - first_offset + length] for offset, length in entries]
+
+    def _segment_ends(self, session_path, starts):
+        # A segment ends where the next one starts, also if a compaction was interrupted before deleting it.
+        return [*starts[1:], starts[-1] + self._segment_length(session_path, starts[-1])]
+
+    def _read_records(self, session_path, start, end):
+        starts = self._segment_starts(session_path)
+        if not starts:
+            return []
+
+        records = []
+        for segment_start, segment_end in zip(starts, self._segment_ends(session_path, starts)):
+            if segment_end <= start or segment_start >= end:
+                continue
+            records.extend(
+                self._read_segment_records(
+                    session_path, segment_start, max(start, segment_start), min(end, segment_end)
+                )
+            )
+        return records
+
+    def read_range(self, session_path, start, end):
+        return [json.loads(record) for record in self._read_records(session_path, start, end)]
+
+    def read_tail(self, session_path, limit):
+        if limit <= 0:
+            return []
+        end = self.count(session_path)
+        return self.read_range(session_path, end - limit, end)
+
+    def clear(self, session_path, keep_last):
+        """Deletes all but the last `keep_last` messages, also the archived ones."""
+        end = self.count(session_path)
+        kept_messages = self.read_tail(session_path, keep_last)
+        _delete_archive(session_path)
+        for legacy_dir in [session_path / "messages", session_path / "messages.migrated"]:
+            if legacy_dir.exists():
+                shutil.rmtree(legacy_dir)
+        log_dir = self._log_dir(session_path)
+        if log_dir.exists():
+            shutil.rmtree(log_dir)
+        if kept_messages:
+            records = [_encode_record(message) for message in kept_messages]
+            self._write_segment(session_path, end - len(kept_messages), records)
+
+    def last_modified(self, session_path):
+        # Legacy sessions are migrated when the user writes the next time, not by the background archival.
+        starts = self._segment_starts(session_path, migrate=False)
+        if not starts:
+            return None
+        return self._segment_paths(session_path, starts[-1])[0].stat().st_mtime
+
+    def _archived_end(self, session_path):
+        archive_files = _archive_files(session_path, "log")
+        return max((int(path.name.split(".")[0].split("-")[2]) for path in archive_files), default=0)
+
+    def prepare_archive(self, session_path, keep_last):
+        """Writes all but the last `keep_last` messages into a gzip compressed archive and prepares the new segments.
+
+        This only reads the segment log and writes new files, so it can run in a thread while messages are
+        appended. The remaining messages of a segment that is archived in part are written to a temporary segment.
+        Returns the plan for `finish_archive`, or None if there is nothing to archive.
+        """
+        starts = self._segment_starts(session_path, migrate=False)
+        if not starts:
+            return None
+        ends = self._segment_ends(session_path, starts)
+        archived_end = self._archived_end(session_path)
+        archive_start = max(starts[0], archived_end)
+        archive_end = ends[-1] - keep_last
+        archive_path = None
+        archived_count = 0
+        if archive_end > archive_start:
+            records = self._read_records(session_path, archive_start, archive_end)
+            archive_path = _write_archive(session_path, "log", archive_start, archive_end, records)
+            archived_count = len(records)
+            archived_end = archive_end
+
+        deleted_starts = [start for start, end in zip(starts, ends) if end <= archived_end]
+        split = None
+        for segment_start, segment_end in zip(starts, ends):
+            if segment_start < archived_end < segment_end:
+                records = self._read_segment_records(session_path, segment_start, archived_end, segment_end)
+                temp_paths = self._temp_segment_paths(session_path, archived_end)
+                for temp_path in temp_paths:
+                    temp_path.unlink(missing_ok=True)
+                self._append_records(*temp_paths, records)
+                split = {"segment_start": segment_start, "segment_end": segment_end, "new_start": archived_end}
+        if not deleted_starts and split is None:
+            return None
+        return {
+            "archived_count": archived_count,
+            "archive_path": archive_path,
+            "deleted_starts": deleted_starts,
+            "split": split,
+        }
+
+    def finish_archive(self, session_path, plan):
+        """Replaces the archived segments with the prepared ones and returns the number of archived messages.
+
+        This runs in the event loop, so no message is appended meanwhile. Messages appended to the split
+        segment while the archive was written are copied to the new segment first.
+        """
+        split = plan["split"]
+        old_starts = plan["deleted_starts"] + ([split["segment_start"]] if split else [])
+        starts = self._segment_starts(session_path, migrate=False)
+        if not set(old_starts) <= set(starts):
+            # The history was cleared while the archive was written.
+            if plan["archive_path"]:
+                plan["archive_path"].unlink(missing_ok=True)
+            if split:
+                for temp_path in self._temp_segment_paths(session_path, split["new_start"]):
+                    temp_path.unlink(missing_ok=True)
+            return 0
+
+        if split:
+            temp_paths = self._temp_segment_paths(session_path, split["new_start"])
+            segment_end = self._segment_ends(session_path, starts)[starts.index(split["segment_start"])]
+            if segment_end > split["segment_end"]:
+                records = self._read_segment_records(
+                    session_path, split["segment_start"], split["segment_end"], segment_end
+                )
+                self._append_records(*temp_paths, records)
+            log_path, idx_path = self._segment_paths(session_path, split["new_start"])
+            os.replace(temp_paths[0], log_path)
+            os.replace(temp_paths[1], idx_path)
+
+        for segment_start in old_starts:
+            log_path, idx_path = self._segment_paths(session_path, segment_start)
+            idx_path.unlink()
+            log_path.unlink()
+        return plan["archived_count"]
+
+    def _temp_segment_paths(self, session_path, start):
+        return [path.with_name(f"{path.name}.tmp") for path in self._segment_paths(session_path, start)]
+
+    def export(self, session_path):
+        """Yields all messages of a session, the archived ones first."""
+        yield from _read_archives(session_path, "messages")
+        yield from _read_archives(session_path, "log")
+        archived_end = self._archived_end(session_path)
+        yield from self.read_range(session_path, max(self.first(session_path), archived_end), self.count(session_path))
+
+
+HISTORY_BACKENDS = {backend.name: backend for backend in [SegmentLogBackend, JsonFilesBackend]}
+
+
+def get_session_backend(session_path):
+    """Returns the backend of the existing history of a session, without migrating legacy json message files."""
+    if (session_path / "messages").exists() and not (session_path / "log").exists():
+        return JsonFilesBackend()
+    return SegmentLogBackend()
+
+
+def migrate_session(session_path, source_backend, target_backend, target_session_path=None):
+    """Copies all messages of a session from one backend to another and returns the number of messages."""
+    messages = source_backend.read_range(session_path, 0, source_backend.count(session_path))
+    target_backend.extend(target_session_path or session_path, messages)
+    return len(messages)
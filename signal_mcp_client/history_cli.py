@@ -0,0 +1,84 @@
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+from signal_mcp_client.history_backends import SegmentLogBackend, get_session_backend
+
+logger = logging.getLogger("signal_mcp_client")
+
+
+def migrate(session_save_dir, delete_legacy):
+    """Converts the `messages/*.json` directories of all sessions into segment logs."""
+    backend = SegmentLogBackend()
+    for session_path in sorted(path for path in session_save_dir.iterdir() if path.is_dir()):
+        legacy_dir = session_path / "messages"
+        if not legacy_dir.exists():
+            continue
+        if (session_path / "log").exists():
+            logger.warning(f"[{session_path.name}] Segment log already exists, skipping migration")
+            continue
+
+        message_count = backend.migrate_legacy_messages(session_path, delete_legacy)
+        logger.info(f"[{session_path.name}] Migrated {message_count} messages")
+
+
+def export(session_save_dir, session_ids, output):
+    """Writes all messages of the sessions, including the archived ones, as json lines."""
+    if not session_ids:
+        session_ids = sorted(
+            path.name for path in session_save_dir.iterdir() if path.is_dir() and not path.name.startswith(".")
+        )
+    for session_id in session_ids:
+        session_path = session_save_dir / session_id
+        message_count = 0
+        for message in get_session_backend(session_path).export(session_path):
+            output.write(json.dumps({"session_id": session_id, "message": message}, ensure_ascii=False) + "\n")
+            message_count += 1
+        logger.info(f"[{session_id}] Exported {message_count} messages")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance tools for the chat history of the Signal MCP Client")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Convert the legacy json message files of all sessions into segment logs."
+    )
+    migrate_parser.add_argument(
+        "--session-save-dir", type=Path, help="Path to the session save directory.", required=True
+    )
+    migrate_parser.add_argument(
+        "--delete-legacy",
+        action="store_true",
+        help="Delete the json message files after the migration instead of renaming the directory to 'messages.migrated'.",
+    )
+
+    export_parser = subparsers.add_parser(
+        "export", help="Export the chat history of sessions, including the archived messages, as json lines."
+    )
+    export_parser.add_argument(
+        "--session-save-dir", type=Path, help="Path to the session save directory.", required=True
+    )
+    export_parser.add_argument(
+        "--session-id", action="append", help="Only export this session. Can be given several times."
+    )
+    export_parser.add_argument("--output", type=Path, help="Write to this file instead of stdout.")
+    args = parser.parse_args()
+
+    # The export writes to stdout by default, so the log goes to stderr then.
+    log_stream = sys.stderr if args.command == "export" else sys.stdout
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] [%(name)s] %(message)s", stream=log_stream)
+    if args.command == "migrate":
+        migrate(args.session_save_dir, args.delete_legacy)
+    elif args.command == "export":
+        if args.output:
+            with open(args.output, "w") as output:
+                export(args.session_save_dir, args.session_id, output)
+        else:
+            export(args.session_save_dir, args.session_id, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
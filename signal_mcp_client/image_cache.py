@@ -0,0 +1,78 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger("signal_mcp_client")
+
+SUFFIX_TO_MEDIA_TYPE = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png", "gif": "image/gif"}
+
+
+def get_cache_dir(session_save_dir):
+    return session_save_dir / ".cache"
+
+
+def _write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # A unique temporary file, so concurrent writes of the same image don't replace each other's file.
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+
+
+def _downscale(image_path, max_edge):
+    with Image.open(image_path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge))
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def prepare_image(cache_dir, image_path, image_hash, max_edge):
+    """Returns the image as a base64 data url, downscaled so that its longest edge is at most `max_edge` pixels.
+
+    The downscaled image is cached by content hash, so every image is only decoded and re-encoded once.
+    Without Pillow installed, the original image is used.
+    """
+    if Image is None:
+        suffix = image_path.suffix.lstrip(".").lower()
+        with open(image_path, "rb") as f:
+            data = f.read()
+        return f"data:{SUFFIX_TO_MEDIA_TYPE.get(suffix, f'image/{suffix}')};base64,{base64.b64encode(data).decode()}"
+
+    cached_path = cache_dir / "images" / image_hash[:2] / f"{image_hash}_{max_edge}.jpg"
+    if cached_path.exists():
+        with open(cached_path, "rb") as f:
+            data = f.read()
+    else:
+        data = _downscale(image_path, max_edge)
+        _write_atomic(cached_path, data)
+        logger.debug(f"Cached downscaled image {image_path} ({os.path.getsize(image_path)} -> {len(data)} bytes)")
+    return f"data:image/jpeg;base64,{base64.b64encode(data).decode()}"
+
+
+def _description_path(cache_dir, image_hashes, model_name, prompt):
+    key = hashlib.sha256(json.dumps([image_hashes, model_name, prompt]).encode("utf-8")).hexdigest()
+    return cache_dir / "descriptions" / key[:2] / f"{key}.json"
+
+
+def get_cached_description(cache_dir, image_hashes, model_name, prompt):
+    description_path = _description_path(cache_dir, image_hashes, model_name, prompt)
+    if not description_path.exists():
+        return None
+    with open(description_path) as f:
+        return json.load(f)["description"]
+
+
+def save_description(cache_dir, image_hashes, model_name, prompt, description):
+    description_path = _description_path(cache_dir, image_hashes, model_name, prompt)
+    _write_atomic(description_path, json.dumps({"description": description}).encode("utf-8"))
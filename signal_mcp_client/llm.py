@@ -0,0 +1,84 @@
+import asyncio
+import logging
+
+from litellm import acompletion, get_llm_provider
+from litellm.utils import supports_prompt_caching
+
+from signal_mcp_client import metrics
+
+logger = logging.getLogger("signal_mcp_client")
+
+CACHE_CONTROL = {"type": "ephemeral"}
+# Providers that only cache the prompt up to explicit breakpoints. Others, like OpenAI, cache automatically.
+CACHE_BREAKPOINT_PROVIDERS = {"anthropic", "bedrock", "vertex_ai"}
+
+
+async def completion(args, **kwargs):
+    """Runs a litellm completion on the event loop without blocking it.
+
+    The request is cancelled after `args.llm_timeout` seconds, also if the provider keeps the connection open.
+    Cancelling the awaiting task cancels the in-flight request.
+    """
+    timeout = args.llm_timeout
+    try:
+        return await asyncio.wait_for(acompletion(timeout=timeout, **kwargs), timeout=timeout)
+    except asyncio.TimeoutError as e:
+        raise TimeoutError(f"LLM call to {kwargs.get('model')} timed out after {timeout} seconds") from e
+
+
+def _with_cache_control(message):
+    # litellm reads the breakpoint of a tool response from the message and not from its content parts.
+    if message["role"] == "tool":
+        return {**message, "cache_control": CACHE_CONTROL}
+    content = message.get("content")
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    # The content parts are shared with the history, so the last part is copied instead of changed in place.
+    return {**message, "content": [*content[:-1], {**content[-1], "cache_control": CACHE_CONTROL}]}
+
+
+def add_cache_breakpoints(model, messages, tools):
+    """Returns copies of the messages and tools with prompt cache breakpoints for providers that support them.
+
+    The breakpoints are set after the tool definitions, the system prompt and the last message, so the next
+    call of the same turn reads the whole previous prompt from the cache. Other models get the messages and
+    tools unchanged.
+    """
+    try:
+        _, provider, _, _ = get_llm_provider(model)
+        if provider not in CACHE_BREAKPOINT_PROVIDERS or not supports_prompt_caching(model):
+            return messages, tools
+    except Exception:
+        return messages, tools
+
+    messages = list(messages)
+    if messages and messages[0]["role"] == "system":
+        messages[0] = _with_cache_control(messages[0])
+    for i in range(len(messages) - 1, 0, -1):
+        if messages[i].get("content"):
+            messages[i] = _with_cache_control(messages[i])
+            break
+
+    if tools:
+        tools = [*tools[:-1], {**tools[-1], "cache_control": CACHE_CONTROL}]
+    return messages, tools
+
+
+def log_usage(session_id, model, response):
+    """Logs and counts the tokens of a completion and how many prompt tokens were read from or written to the cache."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    prompt_tokens_details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(prompt_tokens_details, "cached_tokens", None) or 0
+    cache_read_tokens = getattr(usage, "cache_read_input_tokens", None) or cached_tokens
+    cache_creation_tokens = getattr(usage, "cache_creation_input_tokens", None) or 0
+    metrics.LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, type="prompt")
+    metrics.LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, type="completion")
+    metrics.LLM_TOKENS.inc(cache_read_tokens, model=model, type="cache_read")
+    metrics.LLM_TOKENS.inc(cache_creation_tokens, model=model, type="cache_write")
+    logger.info(
+        f"[{session_id}] LLM usage: {getattr(usage, 'prompt_tokens', 0)} prompt tokens "
+        f"({cache_read_tokens} read from cache, {cache_creation_tokens} written to cache), "
+        f"{getattr(usage, 'completion_tokens', 0)} completion tokens"
+    )
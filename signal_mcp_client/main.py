@@ -1,21 +1,24 @@
 import argparse
 import asyncio
-import base64
 import json
 import logging
 import os
 import sys
-import tempfile
+import time
 import traceback
 from contextlib import AsyncExitStack
 from pathlib import Path
 
-import fal_client
-import requests
 import websockets
 from dotenv import load_dotenv
 
-from signal_mcp_client import mcp_client
+from signal_mcp_client import archival, history, mcp_client, metrics, session_cache, summarization, tool_cache
+from signal_mcp_client.attachment_store import AttachmentStore
+from signal_mcp_client.dispatcher import SessionDispatcher
+from signal_mcp_client.outbound import OutboundScheduler
+from signal_mcp_client.profiling import Profiler
+from signal_mcp_client.signal_api import SignalClient
+from signal_mcp_client.transcription import TRANSCRIPTION_BACKENDS, Transcriber
 
 load_dotenv()
 
@@ -30,6 +33,9 @@ LOG_LEVEL_STR_TO_LEVEL = {
 }
 CLIENT_LOG_LEVEL = LOG_LEVEL_STR_TO_LEVEL[os.getenv("CLIENT_LOG_LEVEL", "INFO")]
 SERVER_LOG_LEVEL = LOG_LEVEL_STR_TO_LEVEL[os.getenv("SERVER_LOG_LEVEL", "INFO")]
+PROFILING = os.getenv("PROFILING", "false").lower() in ("1", "true", "yes")
+PROFILING_SLOW_TURN_SECONDS = float(os.getenv("PROFILING_SLOW_TURN_SECONDS", "10"))
+PROFILING_SNAPSHOT_INTERVAL = float(os.getenv("PROFILING_SNAPSHOT_INTERVAL", "300"))
 
 log_format = "[%(levelname)s] [%(name)s] %(message)s"
 formatter = logging.Formatter(log_format)
@@ -46,230 +52,212 @@ if not SIGNAL_PHONE_NUMBER:
     sys.exit(1)
 
 
-def send_message(recipient, content):
-    """Send a text message using the Signal API (Synchronous)"""
-    if not content or not content.strip():
-        client_logger.info(f"Skipping empty text message send to {recipient}")
-        return
-    url = f"{SIGNAL_HTTP_BASE_URL}/v2/send"
-    payload = {"number": SIGNAL_PHONE_NUMBER, "recipients": [recipient], "message": content}
-    response = requests.post(url, json=payload, timeout=20)
-    response.raise_for_status()
-    client_logger.info(f"Successfully sent text message to {recipient}")
-
-
-def send_attachment(session_id, recipient, content, file_paths):
-    url = f"{SIGNAL_HTTP_BASE_URL}/v2/send"
-    payload = {"number": SIGNAL_PHONE_NUMBER, "recipients": [recipient], "message": content}
-    payload["base64_attachments"] = []
-    for file_path in file_paths:
-        suffix = file_path.split(".")[-1]
-        if suffix == "jpg" or suffix == "jpeg" or suffix == "png":
-            content_type = f"image/{suffix}"
-        elif suffix == "mp4":
-            content_type = "video/mp4"
-        else:
-            raise ValueError(f"Unsupported file type: {file_path}")
-        with open(file_path, "rb") as f:
-            base64_data = base64.b64encode(f.read()).decode("utf-8")
-        payload["base64_attachments"].append(
-            f"data:{content_type};filename={Path(file_path).name};base64,{base64_data}"
-        )
-
-    response = requests.post(url, json=payload, timeout=30)
-    response.raise_for_status()
-    client_logger.info(f"Successfully sent message and attachments {file_paths} to {recipient}")
-
-
-def send_typing_indicator(recipient):
-    """Sends the typing indicator to the recipient."""
-    url = f"{SIGNAL_HTTP_BASE_URL}/v1/typing-indicator/{SIGNAL_PHONE_NUMBER}"
-    payload = {"recipient": recipient}
-    try:
-        response = requests.put(url, json=payload, timeout=5)
-        response.raise_for_status()
-        client_logger.debug(f"Sent typing indicator to {recipient}")
-    except requests.exceptions.RequestException as e:
-        client_logger.warning(f"Failed to send typing indicator to {recipient}: {e}")
-
-
-def clear_typing_indicator(recipient):
-    """Clears the typing indicator for the recipient."""
-    url = f"{SIGNAL_HTTP_BASE_URL}/v1/typing-indicator/{SIGNAL_PHONE_NUMBER}"
-    payload = {"recipient": recipient}
-    try:
-        response = requests.delete(url, json=payload, timeout=5)
-        response.raise_for_status()
-        client_logger.debug(f"Cleared typing indicator for {recipient}")
-    except requests.exceptions.RequestException as e:
-        client_logger.warning(f"Failed to clear typing indicator for {recipient}: {e}")
-
-
-def save_image_attachment(session_dir, session_id, attachment_id):
-    url = f"{SIGNAL_HTTP_BASE_URL}/v1/attachments/{attachment_id}"
-    response = requests.get(url, timeout=30)
-    response.raise_for_status()
-    attachment_data = response.content
-
-    image_dir = session_dir / session_id / "images"
-    image_dir.mkdir(parents=True, exist_ok=True)
-    file_count = len(list(image_dir.glob("*")))
-    _, ext = os.path.splitext(attachment_id)
-    image_path = image_dir / f"image_{file_count:05d}{ext}"
-
-    with open(image_path, "wb") as f:
-        f.write(attachment_data)
-    client_logger.info(f"Successfully fetched and saved attachment ID: {attachment_id} to {image_path}")
-    return image_path
-
-
-def save_image_attachments(session_dir, session_id, attachments):
-    image_file_paths = []
-    for attachment in attachments:
-        content_type = attachment.get("contentType", "").lower()
-        attachment_id = attachment.get("id")
-        if content_type.startswith("image/") and attachment_id:
-            image_file_paths.append(save_image_attachment(session_dir, session_id, attachment_id))
-        else:
-            client_logger.info("Ignoring attachments other then images")
-    return image_file_paths
-
-
-def transcribe_voice_message(attachments):
-    audio_data = None
+async def transcribe_voice_message(signal_client, transcriber, attachments):
+    audio_attachments = []
     for attachment in attachments:
         content_type = attachment.get("contentType", "").lower()
         attachment_id = attachment.get("id")
-        if content_type == "audio/aac" and attachment_id:
-            try:
-                client_logger.info(f"Fetching audio attachment ID: {attachment_id}")
-                url = f"{SIGNAL_HTTP_BASE_URL}/v1/attachments/{attachment_id}"
-                response = requests.get(url, timeout=30)
-                response.raise_for_status()
-                audio_data = response.content
-                client_logger.info(
-                    f"Successfully fetched audio attachment ID: {attachment_id} ({len(audio_data)} bytes)"
-                )
-                # Process only the first audio file found
-                break
-            except Exception as e:
-                client_logger.error(f"Failed to fetch audio attachment {attachment_id}: {e}")
-                return False, None
-
-    if not audio_data:
+        if content_type.startswith("audio/") and attachment_id:
+            audio_attachments.append((attachment_id, content_type))
+    if not audio_attachments:
         return False, None
 
-    client_logger.info("Transcribing fetched audio data...")
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".aac") as temp_audio_file:
-            temp_audio_file.write(audio_data)
-            temp_audio_path = temp_audio_file.name
-        client_logger.info(f"Audio data saved to temporary file: {temp_audio_path}")
-
-        audio_url = fal_client.upload_file(temp_audio_path)
-        client_logger.info(f"Uploaded audio file, URL: {audio_url}")
-        os.remove(temp_audio_path)
-        client_logger.info(f"Temporary file deleted: {temp_audio_path}")
-
-        result = fal_client.subscribe(
-            "fal-ai/whisper",
-            arguments={
-                "audio_url": audio_url,
-                "task": "transcribe",
-            },
-        )
-        client_logger.info(result)
+    async def transcribe_attachment(attachment_id, content_type):
+        client_logger.info(f"Fetching audio attachment ID: {attachment_id}")
+        audio_data = await signal_client.get_attachment(attachment_id)
+        client_logger.info(f"Successfully fetched audio attachment ID: {attachment_id} ({len(audio_data)} bytes)")
+        return await transcriber.transcribe(audio_data, content_type)
 
-        transcribed_text = result.get("text", "") if result else ""
-        client_logger.info(f"Transcription result: {transcribed_text}")
-        return True, transcribed_text
+    try:
+        with metrics.STAGE_SECONDS.time(stage="transcription"):
+            transcribed_texts = await asyncio.gather(
+                *(
+                    transcribe_attachment(attachment_id, content_type)
+                    for attachment_id, content_type in audio_attachments
+                )
+            )
     except Exception as e:
         client_logger.error(f"Error during audio transcription: {e}")
         traceback.print_exc()
-        if "temp_audio_path" in locals() and os.path.exists(temp_audio_path):
-            os.remove(temp_audio_path)
-            client_logger.info(f"Temporary file deleted after error: {temp_audio_path}")
-        return False, "[Error during transcription]"
-
-
-async def process_signal_message(websocket, args, tools, tool_name_to_session):
-    client_logger.info("Waiting for Signal messages...")
-    async for message in websocket:
-        data = json.loads(message)
-        envelope = data.get("envelope", {})
-        session_id = envelope.get("source")
-        data_message = envelope.get("dataMessage", {})
-        user_message = data_message.get("message", "")
-        attachments = data_message.get("attachments", [])
-        quote = data_message.get("quote")
-
-        image_file_paths = save_image_attachments(args.session_save_dir, session_id, attachments)
-        success, transcribed_text = await asyncio.to_thread(transcribe_voice_message, attachments)
-        if success:
-            user_message = transcribed_text
-
-        if quote and quote.get("text"):
-            quoted_text = quote.get("text")
-            for attachment in quote.get("attachments", []):
-                # Image uploaded by the user don't usually have a filename,
-                # so it's not clear if the image can be quoted
-                filename = attachment.get("filename")
-                if filename:
-                    quoted_text += f" [{filename}]"
-
-            user_message = f"{user_message}\n<quote>{quoted_text}</quote>"
-
-        if not user_message and len(image_file_paths) == 0:
-            client_logger.debug(f"[{session_id}] No text message, transcription, or images to process. Skipping.")
-            continue
-        client_logger.info(f"--- [{session_id}] New message received ---")
-
-        if len(image_file_paths) > 0:
-            img_file_paths_str = ", ".join(str(image_file_path) for image_file_path in image_file_paths)
-            user_message = f"[{img_file_paths_str}]\n{user_message}"
+        return False, None
+    return True, "\n".join(transcribed_texts)
+
+
+async def get_user_message(signal_client, attachment_store, transcriber, session_id, envelope):
+    """Returns the text of an envelope with its transcription, quote and image paths, or None if it is empty."""
+    data_message = envelope.get("dataMessage", {})
+    user_message = data_message.get("message", "")
+    attachments = data_message.get("attachments", [])
+    quote = data_message.get("quote")
+
+    with metrics.STAGE_SECONDS.time(stage="attachment_download"):
+        image_file_paths = await attachment_store.save_image_attachments(session_id, attachments)
+    success, transcribed_text = await transcribe_voice_message(signal_client, transcriber, attachments)
+    if success:
+        user_message = transcribed_text
+
+    if quote and quote.get("text"):
+        quoted_text = quote.get("text")
+        for attachment in quote.get("attachments", []):
+            # Image uploaded by the user don't usually have a filename,
+            # so it's not clear if the image can be quoted
+            filename = attachment.get("filename")
+            if filename:
+                quoted_text += f" [{filename}]"
+
+        user_message = f"{user_message}\n<quote>{quoted_text}</quote>"
+
+    if not user_message and len(image_file_paths) == 0:
+        return None
+
+    if len(image_file_paths) > 0:
+        img_file_paths_str = ", ".join(str(image_file_path) for image_file_path in image_file_paths)
+        user_message = f"[{img_file_paths_str}]\n{user_message}"
+    return user_message
+
+
+async def process_envelopes(
+    args,
+    tool_selector,
+    tool_name_to_session,
+    signal_client,
+    attachment_store,
+    transcriber,
+    profiler,
+    summary_scheduler,
+    session_id,
+    envelopes,
+):
+    """Processes the envelopes that a user sent in a short time as a single message and conversation turn."""
+    user_messages = await asyncio.gather(
+        *(
+            get_user_message(signal_client, attachment_store, transcriber, session_id, envelope)
+            for envelope in envelopes
+        ),
+        return_exceptions=True,
+    )
+    for user_message in user_messages:
+        if isinstance(user_message, Exception):
+            # A failed message is skipped, so it doesn't drop the other messages of the batch.
+            client_logger.error(f"[{session_id}] Error while reading message: {user_message!r}")
+    user_messages = [user_message for user_message in user_messages if isinstance(user_message, str) and user_message]
+    if not user_messages:
+        client_logger.debug(f"[{session_id}] No text message, transcription, or images to process. Skipping.")
+        return
+    client_logger.info(f"--- [{session_id}] New message received ---")
+    if len(user_messages) > 1:
+        client_logger.info(f"[{session_id}] Merged {len(user_messages)} messages into one turn")
+    user_message = "\n\n".join(user_messages)
 
-        client_logger.info(
-            f"[{session_id}] Processing message for MCP: {user_message[:100]}{'...' if len(user_message) > 100 else ''}"
-        )
+    client_logger.info(
+        f"[{session_id}] Processing message for MCP: {user_message[:100]}{'...' if len(user_message) > 100 else ''}"
+    )
 
-        await asyncio.to_thread(send_typing_indicator, session_id)
+    outbound = OutboundScheduler(signal_client, session_id)
+    outbound.start()
+    turn_start_time = time.perf_counter()
+    with profiler.profile_turn(session_id):
         try:
             async for response in mcp_client.process_conversation_turn(
-                session_id, args, tools, tool_name_to_session, user_message
+                session_id, args, tool_selector, tool_name_to_session, user_message
             ):
-                if (
-                    "media_file_paths" in response
-                    and response["media_file_paths"] is not None
-                    and len(response["media_file_paths"]) > 0
-                ):
-                    if "text" not in response:
-                        response["text"] = ""
-                    client_logger.info(
-                        f"[{session_id}] Sending attachment: {len(response['media_file_paths'])} media files"
-                    )
-                    await asyncio.to_thread(
-                        send_attachment, session_id, session_id, response["text"], response["media_file_paths"]
-                    )
+                media_file_paths = response.get("media_file_paths") or []
+                if media_file_paths:
+                    client_logger.info(f"[{session_id}] Sending attachment: {len(media_file_paths)} media files")
+                    outbound.send_message(response.get("text", ""), media_file_paths)
                 elif "text" in response:
                     client_logger.info(
                         f"[{session_id}] Sending text response: {response['text'][:100]}{'...' if len(response['text']) > 100 else ''}"
                     )
-                    await asyncio.to_thread(send_message, session_id, response["text"])
-                else:
-                    await asyncio.to_thread(send_typing_indicator, session_id)
-
+                    outbound.send_message(response["text"])
         except Exception as e:
-            await asyncio.to_thread(clear_typing_indicator, session_id)
             client_logger.error(f"[{session_id}] Error during MCP processing: {e}")
             traceback.print_exc()
+        finally:
+            await outbound.finish()
+
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - turn_start_time, stage="turn")
+    client_logger.info(f"--- [{session_id}] Finished processing ---")
 
-        client_logger.info(f"--- [{session_id}] Finished processing ---")
+    if args.summary_model:
+        # The summary is updated in the background, so the turn slot is free for the next message.
+        summary_scheduler.schedule(session_id)
+
+
+async def process_signal_message(websocket, dispatcher):
+    client_logger.info("Waiting for Signal messages...")
+    async for message in websocket:
+        data = json.loads(message)
+        envelope = data.get("envelope", {})
+        session_id = envelope.get("source")
+        if not session_id or "dataMessage" not in envelope:
+            continue
+        metrics.MESSAGES.inc()
+        dispatcher.submit(session_id, envelope)
 
 
 async def main_loop(args):
     async with AsyncExitStack() as exit_stack:
+        if args.metrics_port:
+            metrics_server = await metrics.start_server(args.metrics_host, args.metrics_port)
+            exit_stack.callback(metrics_server.close)
+
         client_logger.info("Starting MCP servers")
-        tool_name_to_session, tools = await mcp_client.start_servers(exit_stack, args, handler, SERVER_LOG_LEVEL)
+        tool_name_to_session, tool_selector = await mcp_client.start_servers(
+            exit_stack, args, handler, SERVER_LOG_LEVEL
+        )
+
+        signal_client = SignalClient(
+            SIGNAL_HTTP_BASE_URL,
+            SIGNAL_PHONE_NUMBER,
+            max_connections=args.signal_max_connections,
+            timeout=args.signal_timeout,
+            max_retries=args.signal_max_retries,
+            max_attachment_bytes=args.max_attachment_size,
+            max_payload_bytes=args.max_attachment_payload_size,
+        )
+        exit_stack.push_async_callback(signal_client.close)
+        attachment_store = AttachmentStore(args.session_save_dir, signal_client)
+        transcriber = Transcriber(
+            TRANSCRIPTION_BACKENDS[args.transcription_backend](),
+            args.session_save_dir / ".cache",
+            max_concurrent_transcriptions=args.max_concurrent_transcriptions,
+        )
+
+        profiler = Profiler(
+            args.session_save_dir / ".profiles",
+            slow_turn_seconds=PROFILING_SLOW_TURN_SECONDS,
+            snapshot_interval=PROFILING_SNAPSHOT_INTERVAL,
+            enabled=PROFILING,
+        )
+        profiler.start()
+        exit_stack.push_async_callback(profiler.stop)
+
+        if args.archive_interval_hours > 0:
+            archival_task = asyncio.create_task(archival.run_archival(args))
+            exit_stack.callback(archival_task.cancel)
+
+        summary_scheduler = summarization.SummaryScheduler(args)
+        exit_stack.push_async_callback(summary_scheduler.close)
+
+        async def handle_envelopes(session_id, envelopes):
+            await process_envelopes(
+                args,
+                tool_selector,
+                tool_name_to_session,
+                signal_client,
+                attachment_store,
+                transcriber,
+                profiler,
+                summary_scheduler,
+                session_id,
+                envelopes,
+            )
+
+        dispatcher = SessionDispatcher(
+            handle_envelopes, args.max_concurrent_turns, debounce_seconds=args.message_debounce_seconds
+        )
+        exit_stack.push_async_callback(dispatcher.close)
 
         websocket_url = f"{SIGNAL_WS_BASE_URL}/v1/receive/{SIGNAL_PHONE_NUMBER}"
         client_logger.info(f"WebSocket URL: {websocket_url}")
@@ -279,7 +267,7 @@ async def main_loop(args):
                 client_logger.info(f"Attempting to connect to WebSocket: {websocket_url}")
                 async with websockets.connect(websocket_url, ping_interval=30, ping_timeout=30) as websocket:
                     client_logger.info("WebSocket connection established.")
-                    await process_signal_message(websocket, args, tools, tool_name_to_session)
+                    await process_signal_message(websocket, dispatcher)
                 client_logger.info("WebSocket connection closed. Will attempt to reconnect...")
             except Exception as e:
                 client_logger.error(f"An unexpected error occurred in the main connection loop: {e}")
@@ -287,7 +275,8 @@ async def main_loop(args):
                 await asyncio.sleep(5)
 
 
-def main():
+def parse_args(argv=None):
+    """Parses the command line arguments and configures the history backend and the caches with them."""
     parser = argparse.ArgumentParser(description="Signal MCP Client")
     parser.add_argument("--config", type=str, help="Path to the config.json file.", required=True)
     parser.add_argument(
@@ -302,8 +291,210 @@ def main():
         help="The default LLM chat message context limit to use.",
         required=True,
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--default-llm-context-token-budget",
+        type=int,
+        default=0,
+        help="The default maximum number of tokens of the chat messages in the LLM context. 0 means no token limit.",
+    )
+    parser.add_argument(
+        "--mcp-startup-timeout",
+        type=float,
+        default=60,
+        help="Timeout in seconds for starting a single MCP server.",
+    )
+    parser.add_argument(
+        "--mcp-health-check-interval",
+        type=float,
+        default=30,
+        help="Interval in seconds for checking that the MCP servers respond. Unresponsive servers are restarted.",
+    )
+    parser.add_argument(
+        "--tool-cache-max-entries",
+        type=int,
+        default=1000,
+        help="Maximum number of cached tool results of the tools with a cache configured in the config.json.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=0,
+        help="Port for serving metrics in the Prometheus text format at /metrics. 0 disables the metrics endpoint.",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        type=str,
+        default="127.0.0.1",
+        help="Host the metrics endpoint listens on.",
+    )
+    parser.add_argument(
+        "--prompt-caching",
+        action="store_true",
+        help="Mark the tools, the system prompt and the chat history as cacheable for providers with prompt caching.",
+    )
+    parser.add_argument(
+        "--max-selected-tools",
+        type=int,
+        default=16,
+        help="Maximum number of MCP tools sent to the LLM, selected by relevance to the recent messages. 0 sends all tools.",
+    )
+    parser.add_argument(
+        "--max-concurrent-turns",
+        type=int,
+        default=8,
+        help="The maximum number of conversation turns processed in parallel over all users.",
+    )
+    parser.add_argument(
+        "--summary-model",
+        type=str,
+        help="Fold messages that fall out of the chat message context into a rolling summary with this model, "
+        "e.g. a cheaper one. The summary is sent after the system prompt. Disabled by default.",
+    )
+    parser.add_argument(
+        "--summary-batch-messages",
+        type=int,
+        default=20,
+        help="Update the summary once this many messages are neither in the summary nor in the context.",
+    )
+    parser.add_argument(
+        "--summary-max-tokens",
+        type=int,
+        default=1000,
+        help="The maximum number of tokens of the summary.",
+    )
+    parser.add_argument(
+        "--message-debounce-seconds",
+        type=float,
+        default=0,
+        help="Messages a user sends within this many seconds of each other are answered together in one turn.",
+    )
+    parser.add_argument(
+        "--max-parallel-tool-calls",
+        type=int,
+        default=4,
+        help="The maximum number of tool calls of one LLM response that are executed in parallel.",
+    )
+    parser.add_argument(
+        "--max-agent-steps",
+        type=int,
+        default=20,
+        help="The maximum number of LLM calls used to answer a single message.",
+    )
+    parser.add_argument(
+        "--max-turn-seconds",
+        type=float,
+        default=600,
+        help="The maximum time in seconds spent answering a single message before the agent loop stops.",
+    )
+    parser.add_argument(
+        "--tool-result-max-chars",
+        type=int,
+        default=20000,
+        help="Tool results longer than this are saved to a file and only a preview is added to the chat history.",
+    )
+    parser.add_argument(
+        "--tool-result-page-size",
+        type=int,
+        default=10000,
+        help="The number of characters per page when the LLM reads a saved tool result.",
+    )
+    parser.add_argument("--llm-timeout", type=float, default=120, help="Timeout in seconds for a single LLM API call.")
+    parser.add_argument(
+        "--signal-max-connections",
+        type=int,
+        default=10,
+        help="The maximum number of pooled connections to the Signal REST API.",
+    )
+    parser.add_argument(
+        "--signal-timeout", type=float, default=30, help="Timeout in seconds for requests to the Signal REST API."
+    )
+    parser.add_argument(
+        "--signal-max-retries",
+        type=int,
+        default=3,
+        help="How often failed requests to the Signal REST API are retried.",
+    )
+    parser.add_argument(
+        "--max-attachment-size",
+        type=int,
+        default=100 * 1024 * 1024,
+        help="The maximum size in bytes of a single file sent as an attachment.",
+    )
+    parser.add_argument(
+        "--max-attachment-payload-size",
+        type=int,
+        default=300 * 1024 * 1024,
+        help="The maximum size in bytes of the base64 encoded attachments of a single message.",
+    )
+    parser.add_argument(
+        "--describe-image-max-edge",
+        type=int,
+        default=1568,
+        help="Images are downscaled to this maximum edge length in pixels before they are described (requires Pillow).",
+    )
+    parser.add_argument(
+        "--transcription-backend",
+        choices=list(TRANSCRIPTION_BACKENDS),
+        default="fal",
+        help="The backend used to transcribe voice messages. 'static' returns a fixed text for testing.",
+    )
+    parser.add_argument(
+        "--max-concurrent-transcriptions",
+        type=int,
+        default=2,
+        help="The maximum number of voice messages transcribed in parallel.",
+    )
+    parser.add_argument(
+        "--history-backend",
+        choices=list(history.HISTORY_BACKENDS),
+        default="segment_log",
+        help="The storage format of the chat history.",
+    )
+    parser.add_argument(
+        "--archive-interval-hours",
+        type=float,
+        default=24,
+        help="Move old messages into compressed archives every this many hours. 0 disables archiving.",
+    )
+    parser.add_argument(
+        "--archive-keep-messages",
+        type=int,
+        default=500,
+        help="The number of recent messages per session that are not archived.",
+    )
+    parser.add_argument(
+        "--archive-idle-days",
+        type=float,
+        default=30,
+        help="Sessions without a new message for this many days only keep their chat message context. 0 disables it.",
+    )
+    parser.add_argument(
+        "--session-cache-max-sessions",
+        type=int,
+        default=256,
+        help="The maximum number of sessions whose settings and recent messages are kept in memory.",
+    )
+    parser.add_argument(
+        "--session-cache-max-bytes",
+        type=int,
+        default=64 * 1024 * 1024,
+        help="The maximum size in bytes of the messages kept in memory over all sessions.",
+    )
+    parser.add_argument(
+        "--session-cache-messages",
+        type=int,
+        default=200,
+        help="The number of recent messages kept in memory per session.",
+    )
+    args = parser.parse_args(argv)
+    history.set_backend(args.history_backend)
+    session_cache.configure(args.session_cache_max_sessions, args.session_cache_max_bytes, args.session_cache_messages)
+    tool_cache.configure(args.tool_cache_max_entries)
+    return args
 
+
+def main():
+    args = parse_args()
     try:
         asyncio.run(main_loop(args))
     except KeyboardInterrupt:
@@ -1,147 +1,272 @@
 import argparse
+import asyncio
+import functools
 import json
 import logging
 import os
+import time
 import traceback
 from contextlib import AsyncExitStack
 
-from litellm import AuthenticationError, completion
-from mcp import ClientSession, StdioServerParameters, types
-from mcp.client.stdio import stdio_client
+from litellm import AuthenticationError
 
-from signal_mcp_client import history
+from signal_mcp_client import history, llm, mcp_servers, metrics, summarization, tool_cache, tool_results
 from signal_mcp_client.build_in_tools import get_build_in_tools, get_settings, run_build_in_tools
+from signal_mcp_client.tool_selection import ToolSelector
 
 logger = logging.getLogger("signal_mcp_client")
 
 
-async def debug_log_handler(params: types.LoggingMessageNotificationParams, server_logger: logging.Logger):
-    if params.level == "debug":
-        server_logger.debug(params.data)
-    elif params.level in ["info", "notice"]:
-        server_logger.info(params.data)
-    elif params.level in ["warning", "alert"]:
-        server_logger.warning(params.data)
-    elif params.level in ["error", "critical", "emergency"]:
-        server_logger.error(params.data)
+async def start_server(server, lazy, cache_dir):
+    """Starts a server and returns its tools. Lazy servers with cached tool schemas are started on their first call.
+
+    The cached tool schemas are updated by the pool whenever a server starts, also when a lazy server is started
+    by its first call.
+    """
+    if lazy:
+        cached_tools = mcp_servers.load_cached_tools(cache_dir, server.name)
+        if cached_tools is not None:
+            logger.info(f"[{server.name}] Using {len(cached_tools)} cached tool(s), the server starts on first use.")
+            return cached_tools
+
+    return await server.start()
 
 
 async def start_servers(
     exit_stack: AsyncExitStack, args: argparse.Namespace, handler: logging.Handler, server_log_level_int: int
 ):
-    """Connects to MCP servers defined in the config using a provided AsyncExitStack."""
+    """Starts the MCP servers defined in the config concurrently and stops them when the AsyncExitStack closes.
+
+    Returns the mapping from tool names to servers and the ToolSelector with the built-in and the MCP tools.
+    """
 
     if os.path.exists(args.config):
         with open(args.config) as f:
-            servers = json.load(f)["servers"]
+            servers_config = json.load(f)["servers"]
     else:
         raise Exception(f"Error: config.json file {args.config} not found.")
 
-    tools = get_build_in_tools(args.available_models)
+    build_in_tools = get_build_in_tools(args.available_models)
+    mcp_tools = []
     tool_name_to_session = {}
+    cache_dir = args.session_save_dir / ".cache"
 
-    logger.info(f"Attempting to connect to {len(servers)} MCP server(s)...")
-    for i, server_config in enumerate(servers):
+    servers = []
+    for i, server_config in enumerate(servers_config):
         server_name = server_config.get("name", f"Server_{i + 1}")
-        logger.info(f"Connecting to MCP Server: {server_name} ({server_config.get('command')})")
-        try:
-            server_params = StdioServerParameters(
-                command=server_config.get("command"), args=server_config.get("args", []), env=server_config.get("env")
-            )
-
-            stdio_transport = await exit_stack.enter_async_context(stdio_client(server_params))
-            stdio, write = stdio_transport
-
-            server_logger = logging.getLogger(server_name)
-            server_logger.setLevel(server_log_level_int)
-            server_logger.addHandler(handler)
-
-            session = ClientSession(
-                stdio, write, logging_callback=lambda params: debug_log_handler(params, server_logger)
+        server_logger = logging.getLogger(server_name)
+        server_logger.setLevel(server_log_level_int)
+        server_logger.addHandler(handler)
+        servers.append(
+            mcp_servers.McpServerPool(
+                server_name,
+                server_config,
+                server_logger,
+                startup_timeout=server_config.get("startup_timeout", args.mcp_startup_timeout),
+                instances=server_config.get("instances", 1),
+                health_check_interval=server_config.get("health_check_interval", args.mcp_health_check_interval),
+                cache_settings=tool_cache.get_cache_settings(server_name, server_config),
+                on_start=functools.partial(mcp_servers.save_cached_tools, cache_dir, server_name),
             )
-            await exit_stack.enter_async_context(session)
-
-            await session.initialize()
-            logger.info(f"[{server_name}] MCP Session Initialized.")
+        )
 
-            response = await session.list_tools()
-            logger.info(f"[{server_name}] Found {len(response.tools)} tool(s).")
+    async def stop_servers():
+        await asyncio.gather(*(server.stop() for server in servers))
 
-            for tool in response.tools:
-                if tool.name in tool_name_to_session:
-                    logger.warning(f"Duplicate tool name '{tool.name}' found. Overwriting previous entry.")
-                tool_name_to_session[tool.name] = session
-                tools.append({"name": tool.name, "description": tool.description, "input_schema": tool.inputSchema})
-                logger.info(f"  - Registered tool: {tool.name}")
+    exit_stack.push_async_callback(stop_servers)
 
-        except Exception as e:
-            logger.error(f"Failed to connect or initialize MCP server '{server_name}': {e}")
-
-    logger.info(f"Connected to MCP servers. Total tools available: {len(tools)}")
-    return tool_name_to_session, tools
+    logger.info(f"Attempting to connect to {len(servers)} MCP server(s)...")
+    server_tools = await asyncio.gather(
+        *(
+            start_server(server, server_config.get("lazy", False), cache_dir)
+            for server, server_config in zip(servers, servers_config)
+        ),
+        return_exceptions=True,
+    )
+
+    for server, server_tool_list in zip(servers, server_tools):
+        if isinstance(server_tool_list, BaseException):
+            error = server_tool_list
+            if isinstance(error, asyncio.TimeoutError):
+                error = f"no response after {server.startup_timeout} seconds"
+            logger.error(f"Failed to connect or initialize MCP server '{server.name}': {error}")
+            continue
+
+        for tool in server_tool_list:
+            if tool["name"] in tool_name_to_session:
+                logger.warning(f"Duplicate tool name '{tool['name']}' found. Overwriting previous entry.")
+                mcp_tools = [mcp_tool for mcp_tool in mcp_tools if mcp_tool["name"] != tool["name"]]
+            tool_name_to_session[tool["name"]] = server
+            mcp_tools.append(tool)
+            logger.info(f"  - Registered tool: {tool['name']}")
+
+    tool_selector = ToolSelector(build_in_tools, mcp_tools, args.max_selected_tools)
+    logger.info(f"Connected to MCP servers. Total tools available: {len(tool_selector.all_tools)}")
+    return tool_name_to_session, tool_selector
 
 
 async def execute_tool_call(args, session_id, tool_name_to_session, tool_name, tool_arguments):
     """Executes a tool call using the appropriate MCP session."""
 
-    success, result = run_build_in_tools(args, session_id, tool_name, tool_arguments)
+    start_time = time.perf_counter()
+    success, result = await run_build_in_tools(args, session_id, tool_name, tool_arguments)
     if success:
+        # Only built-in tools are timed here, MCP tools fall through and are timed as `mcp_tool`.
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="build_in_tool", tool=tool_name)
         return result
 
     session = tool_name_to_session.get(tool_name)
     if not session:
         return f"Error: Tool '{tool_name}' is not available."
 
-    try:
-        result = await session.call_tool(tool_name, tool_arguments)
-        return result.content[0].text
-    except Exception as e:
-        return f"Error executing tool '{tool_name}': {e}"
+    cache_settings = session.cache_settings.get(tool_name)
+    result = None
+    if cache_settings:
+        cache_key = tool_cache.cache.make_key(tool_name, tool_arguments, session_id, cache_settings["scope"])
+        result = tool_cache.cache.get(cache_key)
+        metrics.TOOL_CACHE_LOOKUPS.inc(tool=tool_name, result="hit" if result is not None else "miss")
+        stats = tool_cache.cache.stats()
+        logger.info(
+            f"[{session_id}] Tool result cache {'hit' if result is not None else 'miss'} for '{tool_name}' "
+            f"(hits: {stats['hits']}, misses: {stats['misses']})"
+        )
+
+    if result is None:
+        try:
+            with metrics.STAGE_SECONDS.time(stage="mcp_tool", tool=tool_name):
+                result = await session.call_tool(tool_name, tool_arguments)
+        except Exception as e:
+            return f"Error executing tool '{tool_name}': {e}"
+        if cache_settings and not result.isError:
+            tool_cache.cache.put(cache_key, result, cache_settings["ttl"])
 
+    session_path = args.session_save_dir / session_id
+    result_text, file_notes = tool_results.split_content(session_path, tool_name, result.content)
+    result_text = tool_results.spill_large_result(
+        session_path, result_text, args.tool_result_max_chars, args.tool_result_page_size
+    )
+    return "\n".join(text for text in [result_text, *file_notes] if text)
 
-async def process_conversation_turn(session_id, args, tools, tool_name_to_session, user_message=None):
-    settings = get_settings(args, session_id)
-    session_dir = args.session_save_dir
 
-    if user_message:
-        history.add_user_message(session_dir, session_id, user_message)
+def start_tool_calls(args, session_id, tool_name_to_session, tool_calls):
+    """Starts the tool calls of one LLM response as tasks, running at most `args.max_parallel_tool_calls` at once."""
+    semaphore = asyncio.Semaphore(args.max_parallel_tool_calls)
+
+    async def run_tool_call(tool_name, tool_arguments):
+        async with semaphore:
+            return await execute_tool_call(args, session_id, tool_name_to_session, tool_name, tool_arguments)
+
+    return [
+        asyncio.create_task(run_tool_call(tool_name, tool_arguments)) for _, tool_name, tool_arguments in tool_calls
+    ]
 
-    tool_used = False
-    try:
-        messages = history.get_history(session_dir, session_id, limit=settings["llm_chat_message_context_limit"])
 
-        system_prompt = settings["system_prompt"]
-        if system_prompt and system_prompt.lower() != "none":
-            messages.insert(0, {"role": "system", "content": system_prompt})
+# Built-in tools that change the settings or the history, after which the context is loaded again.
+CONTEXT_CHANGING_TOOLS = {"update_settings", "reset_settings", "reset_chat_history"}
 
-        response = completion(
-            model=settings["model_name"],
-            messages=messages,
-            tools=tools,
-            max_tokens=2000,
+
+def load_context(args, session_id):
+    settings = get_settings(args, session_id)
+    summary = history.get_summary(args.session_save_dir, session_id) if args.summary_model else None
+    if summary:
+        # Messages that are neither in the summary nor in the context yet are sent as well, until the next update.
+        _, count = history.get_message_range(args.session_save_dir, session_id)
+        limit = settings["llm_chat_message_context_limit"]
+        settings["llm_chat_message_context_limit"] = min(
+            max(limit, count - summary["until"]), limit + args.summary_batch_messages
         )
+    messages = history.get_history(args.session_save_dir, session_id, limit=settings["llm_chat_message_context_limit"])
+    return settings, messages, summary
 
-        message = response.choices[0].message
-        history.add_assistant_message(session_dir, session_id, message.content, message.tool_calls)
 
-        if message.tool_calls:
-            tool_used = True
-            for tool_call in message.tool_calls:
-                tool_id = tool_call.id
-                tool_name = tool_call.function.name
-                tool_arguments = json.loads(tool_call.function.arguments)
+async def process_conversation_turn(session_id, args, tool_selector, tool_name_to_session, user_message=None):
+    """Runs the agent loop for one user message until the LLM answers without tool calls.
 
-                tool_result = await execute_tool_call(args, session_id, tool_name_to_session, tool_name, tool_arguments)
+    The history is loaded once per turn. New assistant and tool messages are saved and also appended in memory.
+    The loop stops after `args.max_agent_steps` LLM calls or `args.max_turn_seconds` seconds.
+    """
+    session_dir = args.session_save_dir
 
-                history.add_tool_response(session_dir, session_id, tool_id, tool_name, tool_result)
+    if user_message:
+        history.add_user_message(session_dir, session_id, user_message)
 
-                if tool_name == "reply_to_user":
-                    yield {
-                        "text": tool_arguments["reply_message"],
-                        "media_file_paths": tool_arguments.get("media_file_paths", []),
-                    }
-                else:
-                    yield {}  # send empty message to trigger typing indicator
+    settings, messages, summary = load_context(args, session_id)
+    turn_start_time = time.monotonic()
+    step = 0
+    tools = None
+    try:
+        while True:
+            elapsed_seconds = time.monotonic() - turn_start_time
+            if step >= args.max_agent_steps or elapsed_seconds >= args.max_turn_seconds:
+                error_message = (
+                    f"Stopped processing the message after {step} steps and {elapsed_seconds:.0f} seconds. "
+                    "Please try again or split the task into smaller steps."
+                )
+                logger.warning(f"[{session_id}] {error_message}")
+                history.add_assistant_message(session_dir, session_id, error_message)
+                yield {"text": error_message}
+                return
+            step += 1
+
+            context_messages = history.build_context(
+                messages, settings["llm_chat_message_context_limit"], settings["llm_context_token_budget"]
+            )
+            if summary:
+                context_messages.insert(0, summarization.get_summary_message(summary))
+            system_prompt = settings["system_prompt"]
+            if system_prompt and system_prompt.lower() != "none":
+                context_messages.insert(0, {"role": "system", "content": system_prompt})
+
+            # The tools come first in the cached prompt prefix, so with prompt caching they are selected once per
+            # turn instead of for every step.
+            if tools is None or not args.prompt_caching:
+                tools = tool_selector.select(session_id, messages, settings["pinned_tools"])
+            if args.prompt_caching:
+                context_messages, tools = llm.add_cache_breakpoints(settings["model_name"], context_messages, tools)
+            with metrics.STAGE_SECONDS.time(stage="llm", model=settings["model_name"]):
+                response = await llm.completion(
+                    args,
+                    model=settings["model_name"],
+                    messages=context_messages,
+                    tools=tools,
+                    max_tokens=2000,
+                )
+            llm.log_usage(session_id, settings["model_name"], response)
+
+            message = response.choices[0].message
+            assistant_message = history.add_assistant_message(
+                session_dir, session_id, message.content, message.tool_calls
+            )
+            if assistant_message:
+                messages.append(assistant_message)
+
+            if not message.tool_calls:
+                return
+
+            tool_calls = [
+                (tool_call.id, tool_call.function.name, json.loads(tool_call.function.arguments))
+                for tool_call in message.tool_calls
+            ]
+            tool_tasks = start_tool_calls(args, session_id, tool_name_to_session, tool_calls)
+            try:
+                # The calls run concurrently, but their results are saved and yielded in the order of the tool calls.
+                for (tool_id, tool_name, tool_arguments), tool_task in zip(tool_calls, tool_tasks):
+                    tool_result = await tool_task
+
+                    messages.append(history.add_tool_response(session_dir, session_id, tool_id, tool_name, tool_result))
+
+                    if tool_name == "reply_to_user":
+                        yield {
+                            "text": tool_arguments["reply_message"],
+                            "media_file_paths": tool_arguments.get("media_file_paths", []),
+                        }
+            finally:
+                for tool_task in tool_tasks:
+                    tool_task.cancel()
+
+            if any(tool_name in CONTEXT_CHANGING_TOOLS for _, tool_name, _ in tool_calls):
+                settings, messages, summary = load_context(args, session_id)
+                tools = None
 
     except AuthenticationError as e:
         error_message = (
@@ -161,7 +286,3 @@ async def process_conversation_turn(session_id, args, tools, tool_name_to_sessio
         logger.error(error_message)
         logger.error(stack_trace)
         return
-
-    if tool_used:
-        async for item in process_conversation_turn(session_id, args, tools, tool_name_to_session):
-            yield item
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import os
+
+from mcp import ClientSession, StdioServerParameters, types
+from mcp.client.stdio import stdio_client
+
+logger = logging.getLogger("signal_mcp_client")
+
+HEALTH_CHECK_TIMEOUT = 10
+
+
+async def debug_log_handler(params: types.LoggingMessageNotificationParams, server_logger: logging.Logger):
+    if params.level == "debug":
+        server_logger.debug(params.data)
+    elif params.level in ["info", "notice"]:
+        server_logger.info(params.data)
+    elif params.level in ["warning", "alert"]:
+        server_logger.warning(params.data)
+    elif params.level in ["error", "critical", "emergency"]:
+        server_logger.error(params.data)
+
+
+def tool_to_dict(tool):
+    return {"name": tool.name, "description": tool.description, "input_schema": tool.inputSchema}
+
+
+class McpServer:
+    """A stdio MCP server process and its client session.
+
+    The session lives in a dedicated task, because the stdio transport has to be entered and exited in the same
+    task. This way several servers can be started concurrently and stopped independently of each other.
+    """
+
+    def __init__(self, name, server_config, server_logger, startup_timeout, on_start=None):
+        self.name = name
+        self.server_params = StdioServerParameters(
+            command=server_config.get("command"), args=server_config.get("args", []), env=server_config.get("env")
+        )
+        self.server_logger = server_logger
+        self.startup_timeout = startup_timeout
+        # Called with the tools after every successful start, e.g. to update the cached tool schemas.
+        self.on_start = on_start
+        self.session = None
+        self.tools = None
+        self.outstanding_calls = 0
+        # True if the last start failed, so the pool prefers the other instances until it was restarted.
+        self.failed = False
+        self._task = None
+        self._stop_event = asyncio.Event()
+        self._start_lock = asyncio.Lock()
+
+    async def _run(self, ready):
+        try:
+            async with stdio_client(self.server_params) as (read, write):
+                async with ClientSession(
+                    read, write, logging_callback=lambda params: debug_log_handler(params, self.server_logger)
+                ) as session:
+                    await session.initialize()
+                    response = await session.list_tools()
+                    self.session = session
+                    ready.set_result([tool_to_dict(tool) for tool in response.tools])
+                    await self._stop_event.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            elif not ready.cancelled() and not self._stop_event.is_set():
+                logger.error(f"[{self.name}] MCP server stopped unexpectedly: {e}")
+        finally:
+            self.session = None
+
+    async def start(self):
+        """Starts the server if it isn't running yet and returns its tools."""
+        async with self._start_lock:
+            if self.session is not None:
+                return self.tools
+            logger.info(f"Connecting to MCP Server: {self.name} ({self.server_params.command})")
+            self._stop_event.clear()
+            ready = asyncio.get_running_loop().create_future()
+            self._task = asyncio.create_task(self._run(ready))
+            try:
+                self.tools = await asyncio.wait_for(ready, timeout=self.startup_timeout)
+            except BaseException:
+                self.failed = True
+                # A server that didn't start in time won't react to the stop event, so it is cancelled right away.
+                await self.stop(timeout=0)
+                raise
+            self.failed = False
+            logger.info(f"[{self.name}] MCP Session Initialized. Found {len(self.tools)} tool(s).")
+            if self.on_start is not None:
+                self.on_start(self.tools)
+            return self.tools
+
+    async def stop(self, timeout=5):
+        if self._task is None:
+            return
+        self._stop_event.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            if timeout > 0:
+                logger.warning(f"[{self.name}] MCP server didn't stop in time and was cancelled")
+        self._task = None
+
+    async def call_tool(self, tool_name, tool_arguments):
+        if self.session is None:
+            await self.start()
+        return await self.session.call_tool(tool_name, tool_arguments)
+
+    async def check_health(self):
+        """Returns False if the server failed to start, stopped unexpectedly or doesn't answer a ping."""
+        if self._start_lock.locked():
+            return True
+        if self._task is None:
+            return not self.failed
+        if self.session is None:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=HEALTH_CHECK_TIMEOUT)
+        except Exception:
+            return False
+        return True
+
+
+class McpServerPool:
+    """Runs several instances of the same MCP server and spreads the tool calls over them.
+
+    Every call goes to the instance with the fewest outstanding calls, so calls of different users run in
+    parallel instead of queuing in a single server process. Lazy instances are only started once they are
+    needed. The started instances are checked every `health_check_interval` seconds and after a failed call,
+    and an instance that stopped or doesn't answer a ping is restarted.
+    """
+
+    def __init__(
+        self,
+        name,
+        server_config,
+        server_logger,
+        startup_timeout,
+        instances=1,
+        health_check_interval=30,
+        cache_settings=None,
+        on_start=None,
+    ):
+        self.name = name
+        self.cache_settings = cache_settings or {}
+        self.startup_timeout = startup_timeout
+        self.health_check_interval = health_check_interval
+        self.instances = [
+            McpServer(
+                name if instances == 1 else f"{name}#{i + 1}", server_config, server_logger, startup_timeout, on_start
+            )
+            for i in range(instances)
+        ]
+        self._health_check_task = None
+        self._check_tasks = set()
+        self._checking = set()
+
+    async def start(self):
+        """Starts all instances and returns the tools of the first instance that started."""
+        results = await asyncio.gather(*(instance.start() for instance in self.instances), return_exceptions=True)
+        tools = None
+        for instance, result in zip(self.instances, results):
+            if isinstance(result, BaseException):
+                if len(self.instances) > 1:
+                    logger.warning(f"[{instance.name}] Failed to start MCP server instance: {result!r}")
+            elif tools is None:
+                tools = result
+        if tools is None:
+            raise results[0]
+        # Only a pool that started has its tools registered, so restarting a pool that never started is useless.
+        self._start_health_checks()
+        return tools
+
+    async def stop(self):
+        if self._health_check_task is not None:
+            self._health_check_task.cancel()
+            self._health_check_task = None
+        for check_task in self._check_tasks:
+            check_task.cancel()
+        await asyncio.gather(*(instance.stop() for instance in self.instances))
+
+    async def call_tool(self, tool_name, tool_arguments):
+        self._start_health_checks()
+        instance = min(self.instances, key=lambda instance: (instance.failed, instance.outstanding_calls))
+        instance.outstanding_calls += 1
+        try:
+            return await instance.call_tool(tool_name, tool_arguments)
+        except Exception:
+            check_task = asyncio.create_task(self._check_instance(instance))
+            self._check_tasks.add(check_task)
+            check_task.add_done_callback(self._check_tasks.discard)
+            raise
+        finally:
+            instance.outstanding_calls -= 1
+
+    def _start_health_checks(self):
+        if self._health_check_task is None and self.health_check_interval > 0:
+            self._health_check_task = asyncio.create_task(self._run_health_checks())
+
+    async def _run_health_checks(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(*(self._check_instance(instance) for instance in self.instances))
+
+    async def _check_instance(self, instance):
+        if instance in self._checking:
+            return
+        self._checking.add(instance)
+        try:
+            if await instance.check_health():
+                return
+            logger.warning(f"[{instance.name}] MCP server is not responding, restarting it")
+            await instance.stop(timeout=0)
+            try:
+                await instance.start()
+            except Exception as e:
+                logger.error(f"[{instance.name}] Failed to restart MCP server: {e!r}")
+        finally:
+            self._checking.discard(instance)
+
+
+def get_tool_cache_path(cache_dir, server_name):
+    return cache_dir / "mcp_tools" / f"{server_name}.json"
+
+
+def load_cached_tools(cache_dir, server_name):
+    tool_cache_path = get_tool_cache_path(cache_dir, server_name)
+    if not tool_cache_path.exists():
+        return None
+    with open(tool_cache_path) as f:
+        return json.load(f)
+
+
+def save_cached_tools(cache_dir, server_name, tools):
+    tool_cache_path = get_tool_cache_path(cache_dir, server_name)
+    tool_cache_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = tool_cache_path.with_name(f"{tool_cache_path.name}.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(tools, f, indent=2)
+    os.replace(temp_path, tool_cache_path)
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("signal_mcp_client")
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(label_names, label_values, extra=None):
+    labels = list(zip(label_names, label_values))
+    if extra:
+        labels.append(extra)
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class Metric:
+    """A metric with a fixed set of label names, rendered in the Prometheus text format."""
+
+    type = None
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        # Metrics without labels are reported from the start, also before they are first changed.
+        self._values = {} if self.label_names else {(): 0}
+        registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label_name, "")) for label_name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(buckets)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        bucket_counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                bucket_counts[i] += 1
+        self._values[key] = (bucket_counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the with block in seconds, also if it raises."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        for label_values, (bucket_counts, total, count) in sorted(self._values.items()):
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                labels = _format_labels(self.label_names, label_values, ("le", upper_bound))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.label_names, label_values, ("le", "+Inf"))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+registry = []
+
+STAGE_SECONDS = Histogram(
+    "signal_mcp_client_stage_seconds",
+    "Duration of the processing stages of a message in seconds.",
+    ["stage", "model", "tool"],
+)
+LLM_TOKENS = Counter(
+    "signal_mcp_client_llm_tokens_total",
+    "Tokens used by the LLM calls, by model and token type.",
+    ["model", "type"],
+)
+MESSAGES = Counter(
+    "signal_mcp_client_messages_total",
+    "Signal messages received.",
+)
+TOOL_CACHE_LOOKUPS = Counter(
+    "signal_mcp_client_tool_cache_lookups_total",
+    "Lookups in the tool result cache, by tool and result.",
+    ["tool", "result"],
+)
+QUEUED_MESSAGES = Gauge(
+    "signal_mcp_client_queued_messages",
+    "Messages waiting for the previous message of the same session to be processed.",
+)
+ACTIVE_TURNS = Gauge(
+    "signal_mcp_client_active_turns",
+    "Conversation turns that are currently processed.",
+)
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _handle_request(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+        # The headers are read and ignored.
+        while (await asyncio.wait_for(reader.readline(), timeout=10)).strip():
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, content_type, body = "200 OK", "text/plain; version=0.0.4; charset=utf-8", render().encode()
+        else:
+            status, content_type, body = "404 Not Found", "text/plain; charset=utf-8", b"Not Found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1")
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(host, port):
+    """Serves the metrics in the Prometheus text format at http://host:port/metrics."""
+    server = await asyncio.start_server(_handle_request, host, port)
+    logger.info(f"Serving metrics at http://{host}:{port}/metrics")
+    return server
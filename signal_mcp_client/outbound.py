@@ -0,0 +1,110 @@
+import asyncio
+import logging
+
+import httpx
+
+from signal_mcp_client import metrics
+
+logger = logging.getLogger("signal_mcp_client")
+
+# Signal shows the typing indicator for about 15 seconds, so it is sent again before it runs out.
+TYPING_REFRESH_SECONDS = 10
+# After a reply the indicator is shown again with a short delay, so it isn't sent if the turn ends right after.
+TYPING_RESUME_DELAY_SECONDS = 1
+
+
+def get_attachment_content_type(file_path):
+    suffix = file_path.split(".")[-1]
+    if suffix == "jpg" or suffix == "jpeg" or suffix == "png":
+        return f"image/{suffix}"
+    elif suffix == "mp4":
+        return "video/mp4"
+    raise ValueError(f"Unsupported file type: {file_path}")
+
+
+class OutboundScheduler:
+    """Sends the replies of one turn to a recipient in order and keeps the typing indicator alive meanwhile.
+
+    Replies are queued and sent by a single task, so the turn doesn't wait for the Signal API and the replies
+    arrive in the order they were queued. Failed requests are retried with backoff by the SignalClient.
+    A single timer refreshes the typing indicator every `typing_refresh_seconds` and shortly after a reply,
+    because receiving a message hides the indicator in the Signal apps. `finish` waits for the queued replies
+    and then clears the typing indicator, also if the turn failed.
+    """
+
+    def __init__(self, signal_client, recipient, typing_refresh_seconds=TYPING_REFRESH_SECONDS):
+        self.signal_client = signal_client
+        self.recipient = recipient
+        self.typing_refresh_seconds = typing_refresh_seconds
+        self._queue = asyncio.Queue()
+        self._refresh_typing = asyncio.Event()
+        self._finished = False
+        self._sender_task = None
+        self._typing_task = None
+
+    def start(self):
+        self._sender_task = asyncio.create_task(self._run_sender())
+        self._typing_task = asyncio.create_task(self._run_typing_indicator())
+
+    def send_message(self, text, file_paths=None):
+        if not file_paths and (not text or not text.strip()):
+            logger.info(f"Skipping empty text message send to {self.recipient}")
+            return
+        self._queue.put_nowait((text or "", file_paths or []))
+
+    async def finish(self):
+        try:
+            await self._queue.join()
+        finally:
+            # wait_for can swallow a cancellation if its awaitable finishes at the same time, so the typing
+            # indicator loop also checks this flag.
+            self._finished = True
+            for task in [self._sender_task, self._typing_task]:
+                task.cancel()
+            await asyncio.gather(self._sender_task, self._typing_task, return_exceptions=True)
+            await self._clear_typing_indicator()
+
+    async def _run_sender(self):
+        while True:
+            text, file_paths = await self._queue.get()
+            try:
+                await self._send(text, file_paths)
+            except Exception as e:
+                logger.error(f"Failed to send message to {self.recipient}: {e!r}")
+            finally:
+                self._queue.task_done()
+            if self._queue.empty():
+                self._refresh_typing.set()
+
+    async def _send(self, text, file_paths):
+        if not file_paths:
+            with metrics.STAGE_SECONDS.time(stage="signal_send"):
+                await self.signal_client.send_message(self.recipient, text)
+            logger.info(f"Successfully sent text message to {self.recipient}")
+            return
+
+        attachments = [(file_path, get_attachment_content_type(file_path)) for file_path in file_paths]
+        with metrics.STAGE_SECONDS.time(stage="signal_send_attachments"):
+            await self.signal_client.send_message(self.recipient, text, attachments)
+        logger.info(f"Successfully sent message and attachments {file_paths} to {self.recipient}")
+
+    async def _run_typing_indicator(self):
+        while not self._finished:
+            self._refresh_typing.clear()
+            try:
+                await self.signal_client.send_typing_indicator(self.recipient)
+                logger.debug(f"Sent typing indicator to {self.recipient}")
+            except httpx.HTTPError as e:
+                logger.warning(f"Failed to send typing indicator to {self.recipient}: {e}")
+            try:
+                await asyncio.wait_for(self._refresh_typing.wait(), timeout=self.typing_refresh_seconds)
+                await asyncio.sleep(TYPING_RESUME_DELAY_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _clear_typing_indicator(self):
+        try:
+            await self.signal_client.clear_typing_indicator(self.recipient)
+            logger.debug(f"Cleared typing indicator for {self.recipient}")
+        except httpx.HTTPError as e:
+            logger.warning(f"Failed to clear typing indicator for {self.recipient}: {e}")
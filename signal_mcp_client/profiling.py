@@ -0,0 +1,142 @@
+import asyncio
+import cProfile
+import io
+import logging
+import pstats
+import signal
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger("signal_mcp_client")
+
+# Only the allocating line is kept, more frames make tracing and taking snapshots a lot slower.
+TRACEMALLOC_FRAMES = 1
+TOP_STATS_LIMIT = 50
+
+
+class Profiler:
+    """Opt-in profiling of slow conversation turns and periodic memory allocation snapshots.
+
+    While enabled, turns are profiled with cProfile and turns slower than `slow_turn_seconds` are written to
+    `profile_dir`. Only one turn is profiled at a time, and the profile also contains the work of turns of other
+    sessions that run concurrently. Every `snapshot_interval` seconds the top allocators traced by tracemalloc,
+    and the change since the last snapshot, are written to `profile_dir` as well.
+    Sending SIGUSR1 to the process switches profiling on and off.
+    """
+
+    def __init__(self, profile_dir, slow_turn_seconds=10.0, snapshot_interval=300.0, enabled=False):
+        self.profile_dir = profile_dir
+        self.slow_turn_seconds = slow_turn_seconds
+        self.snapshot_interval = snapshot_interval
+        self.enabled = False
+        self._start_enabled = enabled
+        self._active_profile = None
+        self._snapshot_task = None
+        self._last_snapshot = None
+
+    def start(self):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, self.toggle)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            logger.debug("Switching profiling on and off with SIGUSR1 is not supported on this platform")
+        if self._start_enabled:
+            self.enable()
+
+    async def stop(self):
+        self.disable()
+        try:
+            asyncio.get_running_loop().remove_signal_handler(signal.SIGUSR1)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            pass
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if self.snapshot_interval > 0:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._snapshot_task = asyncio.get_running_loop().create_task(self._run_snapshots())
+        logger.info(f"Profiling enabled, writing profiles to {self.profile_dir}")
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            self._snapshot_task = None
+            self._last_snapshot = None
+            tracemalloc.stop()
+        logger.info("Profiling disabled")
+
+    def _get_file_path(self, prefix, suffix):
+        return self.profile_dir / f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{suffix}"
+
+    @contextmanager
+    def profile_turn(self, session_id):
+        """Profiles the with block and writes the profile if it took longer than `slow_turn_seconds`."""
+        if not self.enabled or self._active_profile is not None:
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler, e.g. a debugger, is already active.
+            yield
+            return
+        self._active_profile = profile
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._active_profile = None
+            duration = time.perf_counter() - start_time
+            if duration >= self.slow_turn_seconds:
+                self._write_profile(profile, session_id, duration)
+
+    def _write_profile(self, profile, session_id, duration):
+        file_path = self._get_file_path(f"turn-{session_id.lstrip('+')}", ".prof")
+        profile.dump_stats(file_path)
+        stream = io.StringIO()
+        stream.write(f"Turn of session {session_id} took {duration:.2f} seconds\n\n")
+        pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(TOP_STATS_LIMIT)
+        file_path.with_suffix(".txt").write_text(stream.getvalue())
+        logger.warning(f"[{session_id}] Slow turn took {duration:.2f} seconds, profile written to {file_path}")
+
+    async def _run_snapshots(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        """Writes the top allocators and their change since the previous snapshot."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ]
+        )
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: {current_bytes / 1024 / 1024:.1f} MiB, peak {peak_bytes / 1024 / 1024:.1f} MiB", ""]
+        lines.append(f"Top {TOP_STATS_LIMIT} allocators:")
+        lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:TOP_STATS_LIMIT])
+        if self._last_snapshot is not None:
+            lines.extend(["", f"Top {TOP_STATS_LIMIT} changes since the previous snapshot:"])
+            lines.extend(str(stat) for stat in snapshot.compare_to(self._last_snapshot, "lineno")[:TOP_STATS_LIMIT])
+        self._last_snapshot = snapshot
+
+        file_path = self._get_file_path("tracemalloc", ".txt")
+        file_path.write_text("\n".join(lines) + "\n")
+        logger.info(f"Memory allocation snapshot written to {file_path}")
@@ -0,0 +1,122 @@
+import json
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger("signal_mcp_client")
+
+
+class SessionState:
+    def __init__(self):
+        self.settings = None
+        self.messages = None
+        self.message_sizes = None
+        # True if `messages` holds the whole history of the session and not only its tail.
+        self.complete = False
+        self.size_bytes = 0
+
+
+class SessionCache:
+    """Write-through cache for the settings and the most recent messages of the active sessions.
+
+    Every session keeps a ring buffer of its last `max_messages` messages. Sessions are evicted in
+    least recently used order once more than `max_sessions` sessions or `max_bytes` bytes of messages are cached.
+    The callers write to disk first and then update the cache, so evicting a session never loses data.
+    """
+
+    def __init__(self, max_sessions=256, max_bytes=64 * 1024 * 1024, max_messages=200):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self._states = OrderedDict()
+        self._total_bytes = 0
+
+    def _get_state(self, key, create=False):
+        state = self._states.get(key)
+        if state is None and create:
+            state = SessionState()
+            self._states[key] = state
+        if state is not None:
+            self._states.move_to_end(key)
+        return state
+
+    def _evict(self):
+        while self._states and (len(self._states) > self.max_sessions or self._total_bytes > self.max_bytes):
+            key, state = self._states.popitem(last=False)
+            self._total_bytes -= state.size_bytes
+            logger.debug(f"Evicted session {key} from the session cache")
+
+    def get_settings(self, key):
+        state = self._get_state(key)
+        if state is None or state.settings is None:
+            return None
+        return dict(state.settings)
+
+    def set_settings(self, key, settings):
+        self._get_state(key, create=True).settings = dict(settings)
+        self._evict()
+
+    def invalidate_settings(self, key):
+        state = self._get_state(key)
+        if state is not None:
+            state.settings = None
+
+    def get_messages(self, key, limit):
+        """Returns the last `limit` messages or None if the cached tail is too short to answer."""
+        state = self._get_state(key)
+        if state is None or state.messages is None:
+            return None
+        if not state.complete and len(state.messages) < limit:
+            return None
+        if limit <= 0:
+            return []
+        return list(state.messages)[-limit:]
+
+    def set_messages(self, key, messages, complete):
+        state = self._get_state(key, create=True)
+        self._total_bytes -= state.size_bytes
+        state.messages = deque()
+        state.message_sizes = deque()
+        state.size_bytes = 0
+        state.complete = complete
+        for message in messages[-self.max_messages :]:
+            self._push_message(state, message)
+        if len(messages) > self.max_messages:
+            state.complete = False
+        self._evict()
+
+    def append_message(self, key, message):
+        state = self._get_state(key)
+        if state is None or state.messages is None:
+            return
+        self._push_message(state, message)
+        self._evict()
+
+    def _push_message(self, state, message):
+        if len(state.messages) >= self.max_messages:
+            state.messages.popleft()
+            evicted_size = state.message_sizes.popleft()
+            state.size_bytes -= evicted_size
+            self._total_bytes -= evicted_size
+            state.complete = False
+        size = len(json.dumps(message))
+        state.messages.append(message)
+        state.message_sizes.append(size)
+        state.size_bytes += size
+        self._total_bytes += size
+
+    def invalidate_messages(self, key):
+        state = self._get_state(key)
+        if state is not None:
+            self._total_bytes -= state.size_bytes
+            state.messages = None
+            state.message_sizes = None
+            state.complete = False
+            state.size_bytes = 0
+
+
+cache = SessionCache()
+
+
+def configure(max_sessions, max_bytes, max_messages):
+    global cache
+    cache = SessionCache(max_sessions=max_sessions, max_bytes=max_bytes, max_messages=max_messages)
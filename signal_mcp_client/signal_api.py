@@ -0,0 +1,170 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import httpx
+
+logger = logging.getLogger("signal_mcp_client")
+
+# Multiple of 3, so every chunk encodes to base64 without padding and the chunks can be concatenated.
+ATTACHMENT_READ_CHUNK_SIZE = 3 * 64 * 1024
+
+
+# These errors happen before the request is sent, so even a request that isn't idempotent can be retried.
+UNSENT_REQUEST_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def base64_length(size):
+    return (size + 2) // 3 * 4
+
+
+class StreamingAttachmentPayload:
+    """The json body of a send request with base64 encoded attachments, encoded chunk by chunk while it is sent.
+
+    Only one chunk of each file is held in memory at a time, independent of the size of the attachments.
+    """
+
+    def __init__(self, payload, attachments):
+        self.attachments = []
+        for file_path, content_type in attachments:
+            data_url_prefix = f"data:{content_type};filename={Path(file_path).name};base64,"
+            # json.dumps escapes the filename, the closing quote is written after the base64 data.
+            self.attachments.append((file_path, json.dumps(data_url_prefix)[:-1].encode("utf-8")))
+        self.head = (json.dumps(payload)[:-1] + ', "base64_attachments": [').encode("utf-8")
+        self.tail = b"]}"
+
+    def content_length(self):
+        length = len(self.head) + len(self.tail) + max(len(self.attachments) - 1, 0)
+        for file_path, prefix in self.attachments:
+            length += len(prefix) + base64_length(os.path.getsize(file_path)) + 1
+        return length
+
+    async def __aiter__(self):
+        yield self.head
+        for i, (file_path, prefix) in enumerate(self.attachments):
+            yield (b"," if i > 0 else b"") + prefix
+            with open(file_path, "rb") as f:
+                while chunk := f.read(ATTACHMENT_READ_CHUNK_SIZE):
+                    yield base64.b64encode(chunk)
+            yield b'"'
+        yield self.tail
+
+
+class SignalClient:
+    """Async client for the signal-cli-rest-api with keep-alive connection pooling.
+
+    Requests that fail with a connection error or a 5xx status code are retried with exponential backoff.
+    POST requests, like sending a message, are only retried if they were never sent, so a slow send that
+    times out isn't delivered several times.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        phone_number,
+        max_connections=10,
+        timeout=30.0,
+        max_retries=3,
+        retry_backoff=0.5,
+        max_attachment_bytes=100 * 1024 * 1024,
+        max_payload_bytes=300 * 1024 * 1024,
+    ):
+        self.base_url = base_url
+        self.phone_number = phone_number
+        self.max_attachment_bytes = max_attachment_bytes
+        self.max_payload_bytes = max_payload_bytes
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def _send_with_retries(self, method, path, send):
+        retried_errors = UNSENT_REQUEST_ERRORS if method == "POST" else httpx.TransportError
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await send()
+                if response.status_code < 500 or attempt == self.max_retries or method == "POST":
+                    response.raise_for_status()
+                    return response
+                error = f"status code {response.status_code}"
+            except retried_errors as e:
+                if attempt == self.max_retries:
+                    raise
+                error = repr(e)
+
+            delay = self.retry_backoff * 2**attempt
+            logger.warning(f"Signal API {method} {path} failed with {error}, retrying in {delay:.1f} seconds")
+            await asyncio.sleep(delay)
+
+    async def request(self, method, path, streaming_payload=None, **kwargs):
+        async def send():
+            if streaming_payload is not None:
+                # A streamed body can only be iterated once, so every attempt gets a fresh iterator.
+                kwargs["content"] = aiter(streaming_payload)
+                kwargs["headers"] = {
+                    "Content-Type": "application/json",
+                    "Content-Length": str(streaming_payload.content_length()),
+                }
+            return await self._client.request(method, path, **kwargs)
+
+        return await self._send_with_retries(method, path, send)
+
+    async def send_message(self, recipient, message, attachments=None):
+        """Sends a message with optional attachments, given as a list of (file path, content type) tuples."""
+        payload = {"number": self.phone_number, "recipients": [recipient], "message": message}
+        if not attachments:
+            await self.request("POST", "/v2/send", json=payload)
+            return
+
+        for file_path, _ in attachments:
+            if os.path.getsize(file_path) > self.max_attachment_bytes:
+                raise ValueError(
+                    f"Attachment {file_path} is larger than the maximum attachment size of {self.max_attachment_bytes} bytes"
+                )
+        streaming_payload = StreamingAttachmentPayload(payload, attachments)
+        if streaming_payload.content_length() > self.max_payload_bytes:
+            raise ValueError(
+                f"The attachments are larger than the maximum payload size of {self.max_payload_bytes} bytes"
+            )
+        await self.request("POST", "/v2/send", streaming_payload=streaming_payload)
+
+    async def send_typing_indicator(self, recipient):
+        await self.request("PUT", f"/v1/typing-indicator/{self.phone_number}", json={"recipient": recipient})
+
+    async def clear_typing_indicator(self, recipient):
+        await self.request("DELETE", f"/v1/typing-indicator/{self.phone_number}", json={"recipient": recipient})
+
+    async def download_attachment(self, attachment_id, file):
+        """Streams an attachment into a binary file object and returns the sha256 hex digest of its content."""
+        path = f"/v1/attachments/{attachment_id}"
+        digest = None
+
+        async def send():
+            nonlocal digest
+            file.seek(0)
+            file.truncate()
+            sha256 = hashlib.sha256()
+            async with self._client.stream("GET", path) as response:
+                if response.is_success:
+                    async for chunk in response.aiter_bytes():
+                        file.write(chunk)
+                        sha256.update(chunk)
+            digest = sha256.hexdigest()
+            return response
+
+        await self._send_with_retries("GET", path, send)
+        return digest
+
+    async def get_attachment(self, attachment_id):
+        response = await self.request("GET", f"/v1/attachments/{attachment_id}")
+        return response.content
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from signal_mcp_client import history, llm, metrics
+from signal_mcp_client.build_in_tools import get_settings
+
+logger = logging.getLogger("signal_mcp_client")
+
+# Older histories are folded in several runs, so a single summarization call stays small.
+MAX_FOLDED_MESSAGES = 200
+MAX_TOOL_TEXT_CHARS = 1000
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a chat between a user and an AI assistant. "
+    "Update the summary with the new messages. Keep facts about the user, their preferences, decisions, open tasks, "
+    "and results of tool calls that may be needed later. Drop small talk and details that are no longer relevant. "
+    "Answer only with the updated summary."
+)
+
+
+def format_message(message):
+    """Returns a short plain text line of a message for the summarization prompt."""
+    content = message.get("content")
+    if isinstance(content, list):
+        text = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    else:
+        text = content or ""
+    if message["role"] == "tool":
+        return f"tool {message.get('name')} returned: {text[:MAX_TOOL_TEXT_CHARS]}"
+    lines = [f"{message['role']}: {text}"] if text else []
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call["function"]
+        lines.append(f"{message['role']} called {function['name']}({function['arguments'][:MAX_TOOL_TEXT_CHARS]})")
+    return "\n".join(lines)
+
+
+def get_summary_message(summary):
+    """Returns the system message with the summary that is inserted after the system prompt."""
+    return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary['text']}"}
+
+
+async def update_summary(args, session_id):
+    """Folds the messages that fell out of the chat message context into the rolling summary of the session.
+
+    Nothing is done until at least `args.summary_batch_messages` messages are not covered by the summary or the
+    context, so the summarization model is only called every few turns. Returns True if the summary was updated.
+    """
+    session_dir = args.session_save_dir
+    settings = get_settings(args, session_id)
+    first, count = history.get_message_range(session_dir, session_id)
+    summary = history.get_summary(session_dir, session_id) or {"text": "", "until": first}
+    start = max(summary["until"], first)
+    end = min(count - settings["llm_chat_message_context_limit"], start + MAX_FOLDED_MESSAGES)
+    if end - start < args.summary_batch_messages:
+        return False
+
+    messages = history.read_messages(session_dir, session_id, start, end)
+    # The context drops tool responses whose tool call was cut off, so they are folded together with the call.
+    while end < count and (next_messages := history.read_messages(session_dir, session_id, end, end + 1)):
+        if next_messages[0]["role"] != "tool":
+            break
+        messages.extend(next_messages)
+        end += 1
+
+    new_messages_text = "\n".join(line for line in map(format_message, messages) if line)
+    prompt = f"Current summary:\n{summary['text'] or '(empty)'}\n\nNew messages:\n{new_messages_text}"
+    with metrics.STAGE_SECONDS.time(stage="summary", model=args.summary_model):
+        response = await llm.completion(
+            args,
+            model=args.summary_model,
+            messages=[{"role": "system", "content": SUMMARY_SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+            max_tokens=args.summary_max_tokens,
+        )
+    llm.log_usage(session_id, args.summary_model, response)
+    text = response.choices[0].message.content
+    if not text:
+        logger.warning(f"[{session_id}] The summarization model returned an empty summary")
+        return False
+
+    history.save_summary(
+        session_dir, session_id, {"text": text, "until": end, "updated": datetime.now().isoformat(timespec="seconds")}
+    )
+    logger.info(f"[{session_id}] Folded {len(messages)} messages into the summary: {text[:60]}...")
+    return True
+
+
+class SummaryScheduler:
+    """Updates the summaries in background tasks, so a turn doesn't wait for the summarization model.
+
+    There is at most one update per session at a time. An update requested while the previous update of the
+    session is still running is skipped, the messages are folded by a later update instead.
+    """
+
+    def __init__(self, args):
+        self._args = args
+        self._tasks = {}
+
+    def schedule(self, session_id):
+        if session_id in self._tasks:
+            return
+        task = asyncio.create_task(self._update(session_id))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+
+    async def _update(self, session_id):
+        try:
+            await update_summary(self._args, session_id)
+        except Exception as e:
+            logger.error(f"[{session_id}] Failed to update the conversation summary: {e!r}")
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
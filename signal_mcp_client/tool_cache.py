@@ -0,0 +1,69 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("signal_mcp_client")
+
+TOOL_CACHE_SCOPES = ("session", "global")
+
+
+class ToolResultCache:
+    """LRU cache for the results of MCP tool calls, with a time to live per entry.
+
+    Which tools are cached is configured per server in the config.json, e.g.
+    `"cache": {"get_weather": {"ttl": 600, "scope": "global"}}`. Results with the `session` scope are only
+    reused for the same user. At most `max_entries` results are kept, the least recently used are evicted first.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def make_key(self, tool_name, tool_arguments, session_id, scope):
+        scope_key = session_id if scope == "session" else None
+        return scope_key, tool_name, json.dumps(tool_arguments, sort_keys=True)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, result, ttl):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+def get_cache_settings(server_name, server_config):
+    """Returns the validated cache settings of the tools of a server, keyed by tool name."""
+    cache_settings = {}
+    for tool_name, tool_cache_config in server_config.get("cache", {}).items():
+        scope = tool_cache_config.get("scope", "session")
+        if scope not in TOOL_CACHE_SCOPES:
+            raise ValueError(f"Invalid cache scope '{scope}' for tool '{tool_name}' of server '{server_name}'")
+        cache_settings[tool_name] = {"ttl": float(tool_cache_config.get("ttl", 300)), "scope": scope}
+    return cache_settings
+
+
+cache = ToolResultCache()
+
+
+def configure(max_entries):
+    global cache
+    cache = ToolResultCache(max_entries=max_entries)
@@ -0,0 +1,97 @@
+import base64
+import logging
+import math
+import mimetypes
+import re
+import time
+import uuid
+
+logger = logging.getLogger("signal_mcp_client")
+
+TOOL_RESULT_PREVIEW_CHARS = 2000
+RESULT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def _new_result_id():
+    return f"{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+
+
+def _save_file(session_path, result_id, index, data, mime_type):
+    extension = mimetypes.guess_extension(mime_type or "") or ".bin"
+    if extension == ".jpe":
+        extension = ".jpg"
+    output_dir = session_path / "tool_outputs"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    file_path = output_dir / f"{result_id}_{index}{extension}"
+    with open(file_path, "wb") as f:
+        f.write(data)
+    return file_path
+
+
+def split_content(session_path, tool_name, content):
+    """Joins the text blocks of an MCP tool result and saves all other content blocks as files.
+
+    Returns the joined text and notes referencing the saved files by path, so the LLM can use them,
+    e.g. to send an image to the user.
+    """
+    result_id = _new_result_id()
+    texts = []
+    notes = []
+    for i, block in enumerate(content):
+        block_type = getattr(block, "type", None)
+        if block_type == "text":
+            texts.append(block.text)
+        elif block_type in ("image", "audio"):
+            file_path = _save_file(session_path, result_id, i, base64.b64decode(block.data), block.mimeType)
+            notes.append(f"[Saved {block_type} from {tool_name} to {file_path}]")
+        elif block_type == "resource":
+            resource = block.resource
+            if getattr(resource, "text", None) is not None:
+                data = resource.text.encode("utf-8")
+                mime_type = resource.mimeType or "text/plain"
+            else:
+                data = base64.b64decode(resource.blob)
+                mime_type = resource.mimeType
+            file_path = _save_file(session_path, result_id, i, data, mime_type)
+            notes.append(f"[Saved resource {resource.uri} from {tool_name} to {file_path}]")
+        elif block_type == "resource_link":
+            notes.append(f"[Resource link: {block.uri}]")
+        else:
+            logger.warning(f"Ignoring unsupported content block of type '{block_type}' from {tool_name}")
+    return "\n".join(texts), notes
+
+
+def spill_large_result(session_path, text, max_chars, page_size):
+    """Saves tool results longer than `max_chars` to a file and returns a preview with a reference to it."""
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+
+    result_id = _new_result_id()
+    result_dir = session_path / "tool_results"
+    result_dir.mkdir(parents=True, exist_ok=True)
+    with open(result_dir / f"{result_id}.txt", "w") as f:
+        f.write(text)
+
+    page_count = math.ceil(len(text) / page_size)
+    logger.info(f"Saved tool result with {len(text)} characters as {result_id}")
+    return (
+        f"{text[:TOOL_RESULT_PREVIEW_CHARS]}\n\n"
+        f"[The tool result was truncated after {TOOL_RESULT_PREVIEW_CHARS} of {len(text)} characters. "
+        f"Use the read_tool_result tool with result_id '{result_id}' and a page from 1 to {page_count} "
+        "to read the full result.]"
+    )
+
+
+def read_tool_result(session_path, result_id, page, page_size):
+    if not RESULT_ID_PATTERN.match(result_id or ""):
+        return f"Error: Invalid result_id '{result_id}'."
+    result_path = session_path / "tool_results" / f"{result_id}.txt"
+    if not result_path.exists():
+        return f"Error: Tool result '{result_id}' not found."
+
+    with open(result_path) as f:
+        text = f.read()
+    page_count = math.ceil(len(text) / page_size)
+    if page < 1 or page > page_count:
+        return f"Error: Page {page} doesn't exist, the tool result has {page_count} pages."
+    return f"[Page {page} of {page_count}]\n{text[(page - 1) * page_size : page * page_size]}"
@@ -0,0 +1,141 @@
+import json
+import logging
+import math
+import re
+from collections import Counter
+
+from litellm import token_counter
+
+logger = logging.getLogger("signal_mcp_client")
+
+# The number of recent messages whose text is used to rank the tools.
+QUERY_MESSAGES = 6
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Common words that match almost every tool description, so they only add noise to the ranking.
+STOPWORDS = {
+    "about", "after", "all", "and", "any", "are", "but", "can", "could", "did", "does", "for", "from", "get",
+    "give", "has", "have", "her", "him", "his", "how", "its", "just", "let", "like", "make", "may", "more", "not",
+    "now", "one", "our", "out", "please", "she", "should", "some", "than", "thank", "thanks", "that", "the",
+    "their", "them", "then", "there", "these", "they", "this", "use", "want", "was", "way", "what",
+    "when", "where", "which", "who", "why", "will", "with", "would", "you", "your",
+}  # fmt: skip
+
+
+def get_tool_name(tool):
+    # Built-in tools use the OpenAI function format, MCP tools the flat format of the MCP server.
+    return tool["function"]["name"] if "function" in tool else tool["name"]
+
+
+def get_tool_description(tool):
+    return (tool["function"] if "function" in tool else tool).get("description") or ""
+
+
+def tokenize(text):
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(token) <= 2 or token in STOPWORDS:
+            continue
+        # A very simple stemming, so "images" matches "image".
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def count_tool_tokens(tool):
+    text = json.dumps(tool)
+    try:
+        return token_counter(text=text)
+    except Exception:
+        return len(text) // 4
+
+
+def get_message_text(message):
+    content = message.get("content")
+    if isinstance(content, str):
+        texts = [content]
+    elif isinstance(content, list):
+        texts = [part.get("text", "") for part in content if isinstance(part, dict)]
+    else:
+        texts = []
+    for tool_call in message.get("tool_calls") or []:
+        texts.append(tool_call["function"]["name"])
+    return " ".join(texts)
+
+
+class ToolSelector:
+    """Selects the tools that are sent to the LLM with every completion call.
+
+    The built-in tools are always included. The MCP tools are ranked by BM25 over their names and descriptions
+    against the text of the recent messages, and the best `max_tools` tools are included, also if they don't
+    match at all. Tools the user pinned in the settings and tools called in the current context are always
+    included as well. If there are no more than `max_tools` MCP tools, or `max_tools` is 0 or less, all tools
+    are included.
+    """
+
+    def __init__(self, build_in_tools, mcp_tools, max_tools):
+        self.build_in_tools = build_in_tools
+        self.mcp_tools = mcp_tools
+        self.max_tools = max_tools
+        self.all_tools = [*build_in_tools, *mcp_tools]
+        self.tool_tokens = {get_tool_name(tool): count_tool_tokens(tool) for tool in self.all_tools}
+
+        self.documents = [Counter(tokenize(f"{tool['name']} {get_tool_description(tool)}")) for tool in mcp_tools]
+        self.document_lengths = [sum(document.values()) for document in self.documents]
+        self.average_document_length = sum(self.document_lengths) / max(len(self.documents), 1)
+        document_frequencies = Counter(token for document in self.documents for token in document)
+        self.idf = {
+            token: math.log(1 + (len(self.documents) - frequency + 0.5) / (frequency + 0.5))
+            for token, frequency in document_frequencies.items()
+        }
+
+    def score(self, query_tokens):
+        scores = []
+        for document, document_length in zip(self.documents, self.document_lengths):
+            score = 0.0
+            for token in query_tokens:
+                frequency = document.get(token, 0)
+                if frequency == 0:
+                    continue
+                length_norm = 1 - BM25_B + BM25_B * document_length / max(self.average_document_length, 1)
+                score += self.idf[token] * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+            scores.append(score)
+        return scores
+
+    def select(self, session_id, messages, pinned_tools):
+        """Returns the tools for the next completion call of a session."""
+        if self.max_tools <= 0 or len(self.mcp_tools) <= self.max_tools:
+            return self.all_tools
+
+        query_tokens = set()
+        called_tools = set()
+        for message in messages[-QUERY_MESSAGES:]:
+            if message["role"] in ("user", "assistant"):
+                query_tokens.update(tokenize(get_message_text(message)))
+        for message in messages:
+            for tool_call in message.get("tool_calls") or []:
+                called_tools.add(tool_call["function"]["name"])
+
+        # Tools with the same score keep their order from the config.
+        ranked_tools = sorted(
+            (-score, i)
+            for i, score in enumerate(self.score(query_tokens))
+            if self.mcp_tools[i]["name"] not in called_tools
+        )
+        selected_names = set(pinned_tools or []) | called_tools
+        selected_names.update(self.mcp_tools[i]["name"] for _, i in ranked_tools[: self.max_tools])
+        selected_tools = [
+            *self.build_in_tools,
+            *(tool for tool in self.mcp_tools if tool["name"] in selected_names),
+        ]
+
+        saved_tokens = sum(self.tool_tokens.values()) - sum(
+            self.tool_tokens[get_tool_name(tool)] for tool in selected_tools
+        )
+        logger.info(
+            f"[{session_id}] Selected {len(selected_tools)} of {len(self.all_tools)} tools, "
+            f"saving about {saved_tokens} prompt tokens"
+        )
+        return selected_tools
@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import fal_client
+
+logger = logging.getLogger("signal_mcp_client")
+
+
+class FalTranscriptionBackend:
+    """Transcribes audio with the fal.ai whisper API, uploading the audio straight from memory."""
+
+    name = "fal"
+
+    async def transcribe(self, audio_data, content_type):
+        audio_url = await fal_client.upload_async(audio_data, content_type)
+        logger.info(f"Uploaded audio file, URL: {audio_url}")
+        result = await fal_client.subscribe_async(
+            "fal-ai/whisper",
+            arguments={
+                "audio_url": audio_url,
+                "task": "transcribe",
+            },
+        )
+        return result.get("text", "") if result else ""
+
+
+class StaticTranscriptionBackend:
+    """Local stand-in that returns a fixed text without calling an external API, e.g. for tests and benchmarks."""
+
+    name = "static"
+
+    def __init__(self, text="This is a transcribed voice message."):
+        self.text = text
+
+    async def transcribe(self, audio_data, content_type):
+        return self.text
+
+
+TRANSCRIPTION_BACKENDS = {backend.name: backend for backend in [FalTranscriptionBackend, StaticTranscriptionBackend]}
+
+
+class Transcriber:
+    """Transcribes audio with a backend, caching the results by audio hash and limiting concurrent transcriptions."""
+
+    def __init__(self, backend, cache_dir, max_concurrent_transcriptions=2):
+        self.backend = backend
+        self.cache_dir = cache_dir / "transcriptions"
+        self._semaphore = asyncio.Semaphore(max_concurrent_transcriptions)
+        # Transcriptions in progress by audio hash, so the same audio arriving twice is only transcribed once.
+        self._in_flight = {}
+
+    def _cache_path(self, audio_hash):
+        return self.cache_dir / self.backend.name / f"{audio_hash}.json"
+
+    async def transcribe(self, audio_data, content_type):
+        audio_hash = hashlib.sha256(audio_data).hexdigest()
+        cache_path = self._cache_path(audio_hash)
+        if cache_path.exists():
+            with open(cache_path) as f:
+                logger.info(f"Using cached transcription for audio {audio_hash[:12]}")
+                return json.load(f)["text"]
+
+        task = self._in_flight.get(audio_hash)
+        if task is None:
+            task = asyncio.create_task(self._transcribe(audio_data, content_type, cache_path))
+            self._in_flight[audio_hash] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(audio_hash, None))
+        else:
+            logger.info(f"Waiting for the transcription of the same audio {audio_hash[:12]} in progress")
+        # Shielded, so a cancelled turn doesn't cancel the transcription for the other turns waiting for it.
+        return await asyncio.shield(task)
+
+    async def _transcribe(self, audio_data, content_type, cache_path):
+        async with self._semaphore:
+            logger.info(f"Transcribing {len(audio_data)} bytes of audio with the {self.backend.name} backend...")
+            text = await self.backend.transcribe(audio_data, content_type)
+        logger.info(f"Transcription result: {text}")
+
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=cache_path.parent, suffix=".tmp", delete=False) as f:
+            json.dump({"text": text}, f)
+        os.replace(f.name, cache_path)
+        return text
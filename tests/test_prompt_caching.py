@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import copy
+
+import pytest
+from litellm import ModelResponse
+from litellm.types.utils import Choices, Message
+
+from signal_mcp_client import history, llm, mcp_client
+from signal_mcp_client.build_in_tools import get_build_in_tools
+from signal_mcp_client.tool_selection import ToolSelector
+
+ANTHROPIC_MODEL = "anthropic/claude-3-5-sonnet-20241022"
+OPENAI_MODEL = "openai/gpt-4o"
+CACHE_CONTROL = {"type": "ephemeral"}
+MCP_TOOLS = [
+    {
+        "name": "echo",
+        "description": "Echo the message back.",
+        "input_schema": {"type": "object", "properties": {"message": {"type": "string"}}},
+    }
+]
+
+
+def make_args(session_save_dir, model):
+    return argparse.Namespace(
+        session_save_dir=session_save_dir,
+        available_models=[model],
+        default_model_name=model,
+        default_system_prompt="You are a test bot.",
+        default_llm_chat_message_context_limit=20,
+        default_llm_context_token_budget=0,
+        prompt_caching=True,
+        summary_model=None,
+        max_agent_steps=5,
+        max_turn_seconds=60,
+        llm_timeout=10,
+        max_parallel_tool_calls=4,
+        tool_result_max_chars=20000,
+        tool_result_page_size=10000,
+    )
+
+
+@pytest.fixture
+def completion_calls(monkeypatch):
+    calls = []
+
+    async def fake_completion(**kwargs):
+        calls.append(copy.deepcopy(kwargs))
+        return ModelResponse(choices=[Choices(message=Message(content="Hello"))])
+
+    monkeypatch.setattr(llm, "acompletion", fake_completion)
+    return calls
+
+
+async def run_turn(args, user_message):
+    tool_selector = ToolSelector(get_build_in_tools(args.available_models), MCP_TOOLS, 0)
+    async for _ in mcp_client.process_conversation_turn("+1", args, tool_selector, {}, user_message):
+        pass
+
+
+def test_anthropic_request_has_cache_breakpoints(tmp_path, completion_calls):
+    args = make_args(tmp_path, ANTHROPIC_MODEL)
+    history.add_assistant_message(tmp_path, "+1", "An earlier answer")
+
+    asyncio.run(run_turn(args, "Hi"))
+
+    messages = completion_calls[0]["messages"]
+    tools = completion_calls[0]["tools"]
+    assert messages[0]["role"] == "system"
+    assert messages[0]["content"][-1]["cache_control"] == CACHE_CONTROL
+    assert messages[-1]["content"][-1]["cache_control"] == CACHE_CONTROL
+    assert "cache_control" not in messages[1]["content"]
+    assert tools[-1]["cache_control"] == CACHE_CONTROL
+    assert all("cache_control" not in tool for tool in tools[:-1])
+
+
+def test_other_providers_get_unchanged_inputs(tmp_path, completion_calls):
+    args = make_args(tmp_path, OPENAI_MODEL)
+    messages = [{"role": "system", "content": "You are a test bot."}, {"role": "user", "content": "Hi"}]
+    tools = copy.deepcopy(MCP_TOOLS)
+
+    assert llm.add_cache_breakpoints(OPENAI_MODEL, messages, tools) == (messages, tools)
+
+    asyncio.run(run_turn(args, "Hi"))
+
+    assert "cache_control" not in str(completion_calls[0]["messages"])
+    assert "cache_control" not in str(completion_calls[0]["tools"])
+
+
+def test_history_is_not_mutated(tmp_path, completion_calls):
+    args = make_args(tmp_path, ANTHROPIC_MODEL)
+    history.add_user_message(tmp_path, "+1", "An earlier question")
+    history.add_assistant_message(tmp_path, "+1", "An earlier answer")
+    messages = history.get_history(tmp_path, "+1", 20)
+    messages_before = copy.deepcopy(messages)
+    tools = get_build_in_tools(args.available_models)
+    tools_before = copy.deepcopy(tools)
+
+    llm.add_cache_breakpoints(ANTHROPIC_MODEL, messages, tools)
+    asyncio.run(run_turn(args, "Hi"))
+
+    assert messages == messages_before
+    assert tools == tools_before
+    assert "cache_control" not in str(history.get_history(tmp_path, "+1", 20))
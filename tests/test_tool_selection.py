@@ -0,0 +1,69 @@
+from signal_mcp_client.build_in_tools import get_build_in_tools
+from signal_mcp_client.tool_selection import ToolSelector, get_tool_name, tokenize
+
+MCP_TOOLS = [
+    {
+        "name": "flux_generate",
+        "description": "Generate an image from a text prompt, e.g. a picture or a drawing.",
+        "input_schema": {"type": "object"},
+    },
+    {
+        "name": "get_forecast",
+        "description": "Get the weather forecast with rain and temperature for a city.",
+        "input_schema": {"type": "object"},
+    },
+    {
+        "name": "search_web",
+        "description": "Search the web and return the top results.",
+        "input_schema": {"type": "object"},
+    },
+]
+
+
+def user_message(text):
+    return {"role": "user", "content": [{"type": "text", "text": text}]}
+
+
+def selected_mcp_tool_names(selector, text, pinned_tools=None):
+    tools = selector.select("+1", [user_message(text)], pinned_tools)
+    return [get_tool_name(tool) for tool in tools[len(selector.build_in_tools) :]]
+
+
+def test_tokenize_drops_stopwords_and_short_tokens():
+    assert tokenize("Draw me a picture of a cat, please") == ["draw", "picture", "cat"]
+    assert tokenize("getForecast images") == ["forecast", "image"]
+
+
+def test_all_tools_are_sent_if_there_are_not_more_than_max_tools():
+    selector = ToolSelector(get_build_in_tools(["m"]), MCP_TOOLS, 3)
+
+    assert selector.select("+1", [user_message("will it rain in Berlin tomorrow?")], []) == selector.all_tools
+
+
+def test_best_matches_are_selected_and_filled_up_by_rank():
+    selector = ToolSelector(get_build_in_tools(["m"]), MCP_TOOLS, 1)
+
+    assert selected_mcp_tool_names(selector, "will it rain in Berlin tomorrow?") == ["get_forecast"]
+    assert selected_mcp_tool_names(selector, "draw me a picture of a cat") == ["flux_generate"]
+    # Without any match the first tools are still sent.
+    assert selected_mcp_tool_names(selector, "hello") == ["flux_generate"]
+
+
+def test_pinned_and_called_tools_are_always_selected():
+    selector = ToolSelector(get_build_in_tools(["m"]), MCP_TOOLS, 1)
+    messages = [
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": "1", "type": "function", "function": {"name": "search_web", "arguments": "{}"}}],
+        },
+        user_message("will it rain in Berlin tomorrow?"),
+    ]
+
+    tools = selector.select("+1", messages, ["flux_generate"])
+
+    assert [get_tool_name(tool) for tool in tools[len(selector.build_in_tools) :]] == [
+        "flux_generate",
+        "get_forecast",
+        "search_web",
+    ]